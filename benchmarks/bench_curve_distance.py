@@ -0,0 +1,90 @@
+"""
+Benchmarks data_utils.curveDistance (KD-tree) against the original double-loop implementation.
+
+Usage (from the repository root):
+    python benchmarks/bench_curve_distance.py [repeats]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from data_utils import curveDistance
+
+def legacyCurveDistance(x1, y1, x2, y2):
+    """
+    EFFECTS: original O(n1 * n2) curve distance, kept here as the benchmark and correctness reference
+    """
+    X = 10.*24*3600
+    Y = max(y1) - min(y1)
+
+    x1_normalized = np.array(x1) / X
+    x2_normalized = np.array(x2) / X
+    y1_normalized = np.array(y1) / Y
+    y2_normalized = np.array(y2) / Y
+
+    n1 = len(x1)
+    n2 = len(x2)
+    d1 = 0
+    d2 = 0
+
+    x1c = (x1_normalized[1:n1] + x1_normalized[0:n1-1])/2
+    x2c = (x2_normalized[1:n2] + x2_normalized[0:n2-1])/2
+    y1c = (y1_normalized[1:n1] + y1_normalized[0:n1-1])/2
+    y2c = (y2_normalized[1:n2] + y2_normalized[0:n2-1])/2
+
+    d1c = np.sqrt((x1_normalized[1:n1] - x1_normalized[0:n1-1])**2 + (y1_normalized[1:n1] - y1_normalized[0:n1-1])**2)
+    d2c = np.sqrt((x2_normalized[1:n2] - x2_normalized[0:n2-1])**2 + (y2_normalized[1:n2] - y2_normalized[0:n2-1])**2)
+
+    len1 = np.sum(d1c)
+    len2 = np.sum(d2c)
+
+    for i in range(0, n1-1):
+        d1 = d1 + d1c[i]*np.min(np.sqrt((x1c[i] - x2c)**2 + (y1c[i] - y2c)**2))
+    for i in range(0, n2-1):
+        d2 = d2 + d2c[i]*np.min(np.sqrt((x2c[i] - x1c)**2 + (y2c[i] - y1c)**2))
+
+    return (d1/len1 + d2/len2)/2
+
+def syntheticCurves(points, seed = 0):
+    """
+    REQUIRES:
+    - points: number of points per curve
+
+    EFFECTS: returns (x1, y1, x2, y2), an hourly "observation" and a "simulation" curve over the
+    same time span with the given number of points each
+    """
+    rng = np.random.default_rng(seed)
+    x = 1.3e9 + np.arange(points) * 3600
+    phase = np.linspace(0, 8 * np.pi, points)
+
+    y1 = 400 + 80 * np.sin(phase) + rng.normal(0, 20, points)
+    y2 = 420 + 70 * np.sin(phase + 0.3) + rng.normal(0, 5, points)
+
+    return x, y1, x.copy(), y2
+
+def bestTime(function, args, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+
+    return best, result
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    for points in (720, 10000):
+        curves = syntheticCurves(points)
+
+        legacyTime, legacyResult = bestTime(legacyCurveDistance, curves, repeats)
+        kdTreeTime, kdTreeResult = bestTime(curveDistance, curves, repeats)
+
+        assert np.isclose(legacyResult, kdTreeResult, rtol = 1e-12, atol = 0), (legacyResult, kdTreeResult)
+
+        print(f"{points} points: legacy {legacyTime * 1e3:.1f} ms, KD-tree {kdTreeTime * 1e3:.2f} ms "
+              f"({legacyTime / kdTreeTime:.0f}x faster), distance {kdTreeResult:.6g}")
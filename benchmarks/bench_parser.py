@@ -0,0 +1,111 @@
+"""
+Benchmarks the vectorized .sat parser in data_parser against the original line-by-line parser.
+
+Usage (from the repository root):
+    python benchmarks/bench_parser.py [simDirectory] [repeats]
+"""
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from config_local import *
+from data_utils import magnitude, multiplyArr
+from data_parser import parseSimRunResults
+
+def legacyParseSimRunResults(file):
+    """
+    REQUIRES:
+    - file: string where sim run data is stored
+
+    EFFECTS: original row-by-row parser, kept here as the benchmark and correctness reference
+    """
+    keys = ["it", "timestamp", "earthCoords", "rho", "velocityVector", "U", "magneticVector", "B",
+            "p", "pe", "ehot", "I01", "I02", "n", "ti"]
+    runResults = {key: [] for key in keys}
+
+    with open(file, "r") as file:
+        fileContents = file.readlines()
+
+        for i, line in enumerate(fileContents):
+            if i >= 2:
+                row = line.strip()
+                row = re.sub(r'\s+', ' ', row)
+                row = row.split(" ")
+
+                runResults["it"].append(row[0])
+                timestampStr = " ".join(row[1:8])
+                runResults["timestamp"].append(datetime.strptime(timestampStr, '%Y %m %d %H %M %S %f'))
+                runResults["earthCoords"].append(row[8:11])
+                runResults["rho"].append(row[11])
+                runResults["velocityVector"].append(row[12:15])
+                runResults["magneticVector"].append(row[15:18])
+                runResults["p"].append(row[18])
+                runResults["pe"].append(row[19])
+                runResults["ehot"].append(row[20])
+                runResults["I01"].append(row[21])
+                runResults["I02"].append(row[22])
+
+                rho = float(row[11])
+                p = float(row[18])
+                runResults["U"].append(magnitude(row[12:15]))
+                runResults["B"].append(magnitude(multiplyArr(row[15:18], 1e5)))
+                runResults["n"].append(rho / protonMass)
+                runResults["ti"].append(p * protonMass / rho / k * 1.e-7)
+
+    return runResults
+
+def checkEquivalent(legacy, vectorized):
+    """
+    REQUIRES:
+    - legacy, vectorized: results of the two parsers for the same file
+
+    EFFECTS: raises AssertionError if the parsers disagree on any key
+    """
+    assert legacy.keys() == vectorized.keys()
+
+    for key in legacy:
+        if key == "timestamp":
+            expected = np.array(legacy[key], dtype = "datetime64[ms]")
+            assert np.array_equal(expected, vectorized[key]), key
+        else:
+            expected = np.array(legacy[key], dtype = np.float64)
+            assert np.allclose(expected, vectorized[key], rtol = 1e-12, atol = 0), key
+
+def timeParser(parser, files, repeats):
+    """
+    EFFECTS: returns the best wall time (s) of parsing all files with parser over repeats
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for file in files:
+            parser(file)
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+if __name__ == "__main__":
+    simDirectory = sys.argv[1] if len(sys.argv) > 1 else configs["simDirectory"]
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    files = sorted(
+        os.path.join(simDirectory, run, configs["simResultsLocation"])
+        for run in os.listdir(simDirectory)
+        if os.path.isdir(os.path.join(simDirectory, run))
+    )
+
+    for file in files:
+        checkEquivalent(legacyParseSimRunResults(file), parseSimRunResults(file))
+
+    legacyTime = timeParser(legacyParseSimRunResults, files, repeats)
+    vectorizedTime = timeParser(parseSimRunResults, files, repeats)
+
+    print(f"Parsed {len(files)} files (best of {repeats})")
+    print(f"legacy:     {legacyTime:.3f} s")
+    print(f"vectorized: {vectorizedTime:.3f} s ({legacyTime / vectorizedTime:.1f}x faster)")
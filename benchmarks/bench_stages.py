@@ -0,0 +1,272 @@
+"""
+Times each pipeline stage on synthetic campaigns and appends the results to a JSON history,
+so regressions show up between commits.
+
+Stages (sizes in brackets):
+- parse [rows]: data_parser.parseSimRunResults of one .sat file
+- difference.<method> [rows]: data_utils.difference_sim_obs of one run's U against the observations
+- index [runs]: data_index.buildRotationIndex of a campaign
+- load [runs]: parsing every run of the campaign (no parsed data cache)
+- scoring [runs]: score_gen.scoreRotation (no score store)
+- plotResults [runs]: plot_gen.plotResults, with its render and savefig stages (see profiling)
+- poyntingFluxPlot [runs]: plot_gen_poyntingflux.plotPoyntingFluxGraph
+
+Observations come from benchmarks/synthetic.FakeCdasWs, nothing is fetched from CDAWeb.
+
+Usage (from the repository root):
+    python benchmarks/bench_stages.py [--full] [--runs N ...] [--rows N ...] [--stages STAGE ...]
+                                      [--repeats N] [--workdir FOLDER] [--history FILE]
+                                      [--threshold RATIO] [--check]
+"""
+import os
+import sys
+import io
+import json
+import time
+import shutil
+import platform
+import argparse
+import contextlib
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from config_local import *
+from synthetic import *
+from data_parser import parseSimRunResults
+from data_utils import difference_sim_obs, toEpochSeconds
+from data_index import buildRotationIndex
+from scrape_data import scrapeData, setCdasClient
+from score_gen import scoreRotation, scrapeWindow
+from profiling import timings
+
+STAGES = ["parse", "difference", "index", "load", "scoring", "plotResults", "poyntingFluxPlot"]
+METHODS = ["mae", "mse", "scc", "curve_distance"]
+
+QUICK_RUNS = [10, 100]
+QUICK_ROWS = [720, 100000]
+FULL_RUNS = [10, 100, 1000, 5000]
+FULL_ROWS = [720, 10000, 100000, 1000000]
+
+ROTATION = "20120516"
+
+def bestTime(function, repeats, setup = None):
+    """
+    REQUIRES:
+    - function: function without arguments to time
+    - repeats: number of timed calls
+    - setup (default = none): function called before every timed call, not timed
+
+    EFFECTS: returns [best wall time (s), result of the last call]
+    """
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+
+    return [best, result]
+
+def runKey(stage, size, sizeName):
+    return f"{stage}[{sizeName}={size}]"
+
+def benchmarkRows(workdir, rows, stages, repeats, results):
+    """
+    EFFECTS: times the per-run stages (parse, difference) on a synthetic .sat file with the given number of rows
+    """
+    satPath = os.path.join(workdir, "sat", f"run_{rows}.sat")
+    if not os.path.exists(satPath):
+        writeSatFile(satPath, rows)
+
+    if "parse" in stages:
+        seconds, runResults = bestTime(lambda: parseSimRunResults(satPath), repeats)
+        results[runKey("parse", rows, "rows")] = {"seconds": seconds}
+
+    if "difference" in stages:
+        runResults = parseSimRunResults(satPath)
+        startTime, alteredStartTime, alteredEndTime = scrapeWindow(runResults["timestamp"])
+        scrapedData = scrapeData(["V"], alteredStartTime, alteredEndTime)
+
+        simTimestamps = toEpochSeconds(runResults["timestamp"])
+        dataTimestamps = toEpochSeconds(scrapedData["V"]["timestamps"])
+
+        for method in METHODS:
+            seconds, value = bestTime(lambda: difference_sim_obs(simTimestamps, runResults["U"], dataTimestamps, scrapedData["V"]["data"], method), repeats)
+            results[runKey(f"difference.{method}", rows, "rows")] = {"seconds": seconds}
+
+def benchmarkRuns(workdir, runs, stages, repeats, results):
+    """
+    EFFECTS: times the per-rotation stages (index, load, scoring, plotting) on a synthetic campaign with the given number of runs
+    """
+    simDirectory = makeCampaign(os.path.join(workdir, f"campaign_{runs}"), runs)
+
+    seconds, rotationData = bestTime(lambda: buildRotationIndex(simDirectory, useCache = False), repeats)
+    if "index" in stages:
+        results[runKey("index", runs, "runs")] = {"seconds": seconds}
+
+    runResults = rotationData[ROTATION]
+    if "load" in stages:
+        seconds, result = bestTime(runResults.preload, repeats, setup = runResults.unload)
+        results[runKey("load", runs, "runs")] = {"seconds": seconds}
+
+    runResults.preload()
+
+    if "scoring" in stages or "poyntingFluxPlot" in stages:
+        seconds, scores = bestTime(lambda: scoreRotation(ROTATION, rotationData, writeDataFile = False), repeats)
+        if "scoring" in stages:
+            results[runKey("scoring", runs, "runs")] = {"seconds": seconds}
+
+    if "plotResults" in stages:
+        from plot_gen import plotResults
+
+        # keeps the stage breakdown of the fastest call
+        best = None
+        for _ in range(repeats):
+            timings.reset()
+            start = time.perf_counter()
+            plotResults(ROTATION, rotationData, showProgress = False)
+            seconds = time.perf_counter() - start
+
+            if best is None or seconds < best["seconds"]:
+                best = {"seconds": seconds, "stages": {name: stage["seconds"] for name, stage in timings.report()["stages"].items()}}
+
+        results[runKey("plotResults", runs, "runs")] = best
+
+    if "poyntingFluxPlot" in stages:
+        from plot_gen_poyntingflux import plotPoyntingFluxGraph
+
+        poyntingFluxes = [float(poyntingFlux) for poyntingFlux in scores["poyntingFluxes"]]
+        seconds, result = bestTime(lambda: plotPoyntingFluxGraph(scores["diffAverages"], scores["filteredDiffValues"], poyntingFluxes, ROTATION, configs["plotSaveFolder"], False, scores["fluxFit"]), repeats)
+        results[runKey("poyntingFluxPlot", runs, "runs")] = {"seconds": seconds}
+
+    runResults.unload()
+
+def gitCommit():
+    """
+    EFFECTS: returns [commit hash, whether the working tree has changes], or [None, None] outside of a git repository
+    """
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd = root, capture_output = True, text = True, check = True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd = root, capture_output = True, text = True, check = True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return [None, None]
+
+    return [commit, len(status.strip()) > 0]
+
+def readHistory(path):
+    """
+    EFFECTS: returns the list of previous benchmark entries in the history file, empty if there is none
+    """
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return []
+
+def compareWithHistory(history, entry, threshold):
+    """
+    REQUIRES:
+    - history: previous entries (see readHistory)
+    - entry: new entry
+    - threshold: slowdown ratio above which a benchmark counts as a regression
+
+    EFFECTS: prints each benchmark's time next to its latest previous time on the same machine,
+    returns the names of the benchmarks that regressed
+    """
+    regressions = []
+
+    for name, result in entry["results"].items():
+        previous = None
+        for oldEntry in reversed(history):
+            if oldEntry["machine"] == entry["machine"] and name in oldEntry["results"]:
+                previous = oldEntry
+                break
+
+        line = f"{name:<40} {result['seconds'] * 1e3:10.2f} ms"
+        if previous is not None:
+            ratio = result["seconds"] / previous["results"][name]["seconds"]
+            line += f"   {ratio:5.2f}x vs {previous['commit']}"
+            if ratio > threshold:
+                line += "  REGRESSION"
+                regressions.append(name)
+
+        print(line)
+
+    return regressions
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark the pipeline stages on synthetic campaigns.")
+    parser.add_argument("--full", action = "store_true", help = f"Use the full size sweep (runs {FULL_RUNS}, rows {FULL_ROWS}) instead of runs {QUICK_RUNS}, rows {QUICK_ROWS}")
+    parser.add_argument("--runs", type = int, nargs = "+", help = "Runs per rotation to benchmark the index, load, scoring and plot stages with")
+    parser.add_argument("--rows", type = int, nargs = "+", help = "Rows per run to benchmark the parse and difference stages with")
+    parser.add_argument("--stages", nargs = "+", choices = STAGES, default = STAGES, help = "Stages to benchmark. Default: all")
+    parser.add_argument("--repeats", type = int, default = 3, help = "Number of timed calls per benchmark, the best one is kept. Default: 3")
+    parser.add_argument("--workdir", help = "Folder for the synthetic campaigns and outputs, kept and reused between calls. Default: a temporary folder")
+    parser.add_argument("--history", default = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.json"), help = "JSON file the results are appended to. Default: benchmarks/history.json")
+    parser.add_argument("--threshold", type = float, default = 1.25, help = "Slowdown vs the previous result above which a benchmark is reported as a regression. Default: 1.25")
+    parser.add_argument("--check", action = "store_true", help = "Exit with status 1 if any benchmark regressed")
+    args = parser.parse_args(argv)
+
+    runSizes = args.runs or (FULL_RUNS if args.full else QUICK_RUNS)
+    rowSizes = args.rows or (FULL_ROWS if args.full else QUICK_ROWS)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix = "awsom_bench_")
+    os.makedirs(workdir, exist_ok = True)
+
+    # outputs go to the workdir, observations come from the fake client only
+    configs["outputDataFolder"] = os.path.join(workdir, "output_data")
+    configs["plotSaveFolder"] = os.path.join(workdir, "output_plots")
+    configs["omniCacheFolder"] = None
+    configs["profile"] = False
+    os.makedirs(configs["outputDataFolder"], exist_ok = True)
+    setCdasClient(FakeCdasWs())
+
+    results = dict()
+    try:
+        # the pipeline's progress output is not part of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            for rows in rowSizes:
+                benchmarkRows(workdir, rows, args.stages, args.repeats, results)
+
+            for runs in runSizes:
+                benchmarkRuns(workdir, runs, args.stages, args.repeats, results)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors = True)
+
+    commit, dirty = gitCommit()
+    entry = {
+        "date": datetime.now(timezone.utc).isoformat(timespec = "seconds"),
+        "commit": commit,
+        "dirty": dirty,
+        "machine": f"{platform.node()} {platform.machine()}",
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "repeats": args.repeats,
+        "results": results
+    }
+
+    history = readHistory(args.history)
+    regressions = compareWithHistory(history, entry, args.threshold)
+
+    history.append(entry)
+    with open(args.history, "w") as file:
+        json.dump(history, file, indent = 4)
+
+    print(f"\nAppended {len(results)} results to {args.history}")
+    if len(regressions) > 0:
+        print(f"{len(regressions)} regression(s) over {args.threshold}x: {regressions}")
+
+    return 1 if args.check and len(regressions) > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+Deterministic synthetic inputs for the benchmarks: .sat trajectory files, whole simulation
+campaigns (run###_AWSoM folders with key_params.txt) and a CdasWs stand-in returning OMNI arrays.
+
+Everything generated here only depends on its arguments, so benchmark results are comparable
+between commits and machines.
+"""
+import os
+import shutil
+from datetime import datetime
+
+import numpy as np
+
+from config_local import *
+
+SAT_HEADER = [
+    "Satellite data for Satellite: IH/TRAJECTORY/earth.dat",
+    "it year mo dy hr mn sc msc X Y Z rho ux uy uz bx by bz p pe ehot I01 I02"
+]
+
+# time span covered by every synthetic run, like a 30 day simulation with hourly output
+RUN_START = np.datetime64("2012-05-01T00:00:00", "ms")
+RUN_HOURS = 720
+
+# poynting flux values of a synthetic sweep, campaigns cycle through them
+SWEEP_FLUXES = [3e5 + 5e4 * i for i in range(19)]
+
+def satColumns(rows, poyntingFlux = 5e5, seed = 0):
+    """
+    REQUIRES:
+    - rows: number of rows, spread evenly over RUN_HOURS
+    - poyntingFlux (default = 5e5): poynting flux of the run, shifts its solar wind speed and density
+
+    EFFECTS: returns a (rows, 23) float array with the columns of a .sat file (see SAT_HEADER)
+    """
+    rng = np.random.default_rng(seed)
+
+    timestamps = RUN_START + (np.arange(rows) * (RUN_HOURS * 3600 * 1000 / rows)).astype("timedelta64[ms]")
+    hours = (timestamps - RUN_START).astype(np.float64) / 3600e3
+    fields = [timestamps.astype(f"datetime64[{unit}]") for unit in ("Y", "M", "D", "h", "m", "s")]
+
+    columns = np.empty((rows, 23))
+    columns[:, 0] = 5000
+    columns[:, 1] = fields[0].astype(np.int64) + 1970
+    columns[:, 2] = (fields[1] - fields[0]).astype(np.int64) + 1
+    columns[:, 3] = (fields[2] - fields[1]).astype(np.int64) + 1
+    for i in range(3, 6):
+        columns[:, i + 1] = (fields[i] - fields[i - 1]).astype(np.int64)
+    columns[:, 7] = (timestamps - fields[5]).astype(np.int64)
+
+    # earth trajectory
+    angle = 2 * np.pi * hours / (365.25 * 24)
+    columns[:, 8] = 215 * np.cos(angle)
+    columns[:, 9] = 215 * np.sin(angle)
+    columns[:, 10] = -16 + 0.1 * np.sin(angle * 12)
+
+    # solar wind: faster and thinner with a higher poynting flux
+    scale = poyntingFlux / 5e5
+    phase = 2 * np.pi * hours / (27 * 24)
+    speed = (380 + 60 * scale) * (1 + 0.25 * np.sin(phase)) + rng.normal(0, 5, rows)
+    density = (6 / scale) * (1 + 0.4 * np.cos(phase)) + np.abs(rng.normal(0, 0.2, rows))
+    temperature = 1e5 * (1 + 0.5 * np.sin(phase + 1)) * scale
+    field = 5e-5 * (1 + 0.3 * np.cos(phase + 2))
+
+    rho = density * protonMass
+    columns[:, 11] = rho
+    columns[:, 12:15] = speed[:, None] * np.array([0.8, -0.6, -0.05])
+    columns[:, 15:18] = field[:, None] * np.array([0.6, 0.5, -0.62])
+    columns[:, 18] = temperature * rho * k * 1e7 / protonMass
+    columns[:, 19] = columns[:, 18] * 6
+    columns[:, 20] = columns[:, 18] * 9
+    columns[:, 21] = 1.3e-13 * (1 + 0.1 * np.sin(phase))
+    columns[:, 22] = 7.5e-13 * (1 + 0.1 * np.cos(phase))
+
+    return columns
+
+def writeSatFile(path, rows, poyntingFlux = 5e5, seed = 0):
+    """
+    REQUIRES:
+    - path: file to write, its folder is created if needed
+    - rows, poyntingFlux, seed: see satColumns
+
+    EFFECTS: writes a synthetic .sat file in the layout of the simulation output
+    """
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    rowFormat = "%7d %4d %02d %02d %02d %02d %02d %03d" + " %13.5E" * 15
+
+    with open(path, "w") as file:
+        file.write("\n".join(SAT_HEADER) + "\n")
+        np.savetxt(file, satColumns(rows, poyntingFlux, seed), fmt = rowFormat)
+
+def makeCampaign(simDirectory, runs, rows = RUN_HOURS, rotation = "20120516"):
+    """
+    REQUIRES:
+    - simDirectory: folder to create the run###_AWSoM folders in
+    - runs: number of runs, all in the same rotation
+    - rows (default = RUN_HOURS): rows per run
+
+    EFFECTS: creates a sweep of runs cycling through SWEEP_FLUXES, unless simDirectory already holds
+    exactly this campaign. Runs of the same poynting flux share one hard linked .sat file (copied if
+    the filesystem doesn't support links), so large campaigns stay small on disk. Returns simDirectory.
+    """
+    marker = os.path.join(simDirectory, ".campaign")
+    description = f"{runs} {rows} {rotation}"
+
+    if os.path.exists(marker):
+        with open(marker, "r") as file:
+            if file.read() == description:
+                return simDirectory
+
+        shutil.rmtree(simDirectory)
+
+    satFiles = dict()
+    for i in range(runs):
+        poyntingFlux = SWEEP_FLUXES[i % len(SWEEP_FLUXES)]
+        runFolder = os.path.join(simDirectory, f"run{i + 1:03d}_AWSoM")
+        os.makedirs(runFolder, exist_ok = True)
+
+        with open(os.path.join(runFolder, configs["simParamLocation"]), "w") as file:
+            file.write(f"model=AWSoM\nmap=GONG_maps/GONG_{rotation}_0000.fits\nPoyntingFluxPerBSi={poyntingFlux:g}\nrealizations=1\n")
+
+        satPath = os.path.join(runFolder, configs["simResultsLocation"])
+        if poyntingFlux not in satFiles:
+            writeSatFile(satPath, rows, poyntingFlux, seed = i)
+            satFiles[poyntingFlux] = satPath
+        else:
+            os.makedirs(os.path.dirname(satPath), exist_ok = True)
+            try:
+                os.link(satFiles[poyntingFlux], satPath)
+            except OSError:
+                shutil.copyfile(satFiles[poyntingFlux], satPath)
+
+    with open(marker, "w") as file:
+        file.write(description)
+
+    return simDirectory
+
+class FakeColumn:
+    """
+    Column of a FakeCdasWs result, exposes its array as .values like the xarray result of CdasWs
+    """
+
+    def __init__(self, values):
+        self.values = values
+
+class FakeCdasWs:
+    """
+    CdasWs stand-in returning hourly OMNI-like observations (see scrape_data.setCdasClient).
+    Each value only depends on its timestamp, so overlapping requests agree with each other and every
+    run sees the same data. Every 37th hour is missing (nan), like gaps in the real dataset.
+    """
+
+    BASE_VALUES = {"V": 420, "N": 5, "T": 1e5, "ABS_B": 5}
+
+    def __init__(self):
+        self.requests = 0
+
+    def get_data(self, dataset, vars, startTime, endTime):
+        self.requests += 1
+
+        start = np.datetime64(datetime.fromisoformat(str(startTime).replace("Z", "")), "s")
+        end = np.datetime64(datetime.fromisoformat(str(endTime).replace("Z", "")), "s")
+
+        # hourly averages are stamped at the middle of the hour
+        first = start.astype("datetime64[h]") + np.timedelta64(30, "m")
+        if first < start:
+            first += np.timedelta64(1, "h")
+
+        epoch = np.arange(first, end + np.timedelta64(1, "s"), np.timedelta64(1, "h"))
+        hours = epoch.astype(np.int64) / 3600
+        phase = 2 * np.pi * hours / (27 * 24)
+
+        data = {"Epoch": FakeColumn(epoch.astype("datetime64[ns]"))}
+        for i, var in enumerate(vars):
+            values = self.BASE_VALUES.get(var, 1) * (1 + 0.3 * np.sin(phase + i) + 0.05 * np.sin(hours * 12.9898))
+            values[np.floor(hours).astype(np.int64) % 37 == 0] = np.nan
+            data[var] = FakeColumn(values)
+
+        return {"http": {"status_code": 200}}, data
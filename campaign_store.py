@@ -0,0 +1,159 @@
+import os
+import json
+import numpy as np
+from config_local import *
+from data_parser import *
+from data_cache import runFingerprint
+from data_utils import atomicWrite
+
+# data path -> read-only memory map of a campaign store's records, opened once per process
+openStores = dict()
+
+def campaignStoreFolder():
+    """
+    EFFECTS: returns the folder where the campaign store is kept (inside outputDataFolder)
+    """
+    return os.path.join(configs["outputDataFolder"], "campaign_store")
+
+def campaignStorePaths():
+    """
+    EFFECTS: returns [data path, index path] of the campaign store. The data file holds the
+    RUN_RESULT_DTYPE records of every run back to back (raw, without a header), grouped by
+    rotation. The index (.json) holds each rotation's and run's [start, stop) record range
+    plus each run's params and fingerprint.
+    """
+    folder = campaignStoreFolder()
+    return [os.path.join(folder, "campaign.dat"), os.path.join(folder, "campaign.json")]
+
+def storeRecords(dataPath):
+    """
+    REQUIRES:
+    - dataPath: data path of a campaign store (see campaignStorePaths)
+
+    EFFECTS: returns all records of the store as a read-only memory map. The file is only mapped
+    once per process, so worker processes reading the same store share the OS page cache
+    instead of holding their own copies.
+    """
+    if dataPath not in openStores:
+        if os.path.getsize(dataPath) == 0:
+            openStores[dataPath] = np.empty(0, dtype = RUN_RESULT_DTYPE)
+        else:
+            openStores[dataPath] = np.memmap(dataPath, dtype = RUN_RESULT_DTYPE, mode = "r")
+
+    return openStores[dataPath]
+
+def readCampaignIndex():
+    """
+    EFFECTS: returns the campaign store's index, or None if there is no complete store
+    written by the current parser version
+    """
+    dataPath, indexPath = campaignStorePaths()
+
+    try:
+        with open(indexPath, "r") as file:
+            index = json.load(file)
+
+        if index["parserVersion"] != parserVersion:
+            return None
+
+        # the index is written after the data, a store is only complete once their sizes agree
+        if os.path.getsize(dataPath) != index["rows"] * RUN_RESULT_DTYPE.itemsize:
+            return None
+    except (OSError, ValueError, KeyError):
+        return None
+
+    return index
+
+def buildCampaignStore(rotationData, executor = None):
+    """
+    REQUIRES:
+    - rotationData: dict of rotation name -> RotationRuns (see data_index.buildRotationIndex)
+    - executor (default = None): process pool to load runs on, see data_index.createIndexPool
+
+    EFFECTS: packs the results, params and fingerprints of every run in rotationData into the
+    campaign store, replacing the previous store. Rotations are loaded (from the parsed data
+    cache where possible) and freed one at a time. Returns the number of runs stored.
+    """
+    folder = campaignStoreFolder()
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok = True)
+
+    dataPath, indexPath = campaignStorePaths()
+    index = {"parserVersion": parserVersion, "rows": 0, "rotations": dict()}
+
+    def writeRecords(file):
+        rows = 0
+
+        for rotation, runResults in rotationData.items():
+            runResults.preload(executor)
+            rotationStart = rows
+            runs = dict()
+
+            for run in runResults:
+                data = runResults[run].data
+                file.write(np.ascontiguousarray(data).tobytes())
+
+                runs[run] = {
+                    "params": runResults.runParams[run],
+                    "fingerprint": runFingerprint(runResults.runFolder(run)),
+                    "start": rows,
+                    "stop": rows + len(data)
+                }
+                rows += len(data)
+
+            runResults.unload()
+            index["rotations"][rotation] = {"start": rotationStart, "stop": rows, "runs": runs}
+
+        index["rows"] = rows
+
+    atomicWrite(dataPath, writeRecords, "wb")
+    atomicWrite(indexPath, lambda file: json.dump(index, file), "w")
+
+    # a previous mapping of the store refers to the replaced file
+    openStores.pop(dataPath, None)
+
+    return sum(len(rotationIndex["runs"]) for rotationIndex in index["rotations"].values())
+
+def attachCampaignStore(rotationData):
+    """
+    REQUIRES:
+    - rotationData: dict of rotation name -> RotationRuns (see data_index.buildRotationIndex)
+
+    EFFECTS: lets every run that is in the campaign store and unchanged since the store was built
+    (same fingerprint) read its results from the store instead of the parsed data cache or its
+    .sat file. Rotations that don't use the cache or are rebuilding it are skipped.
+    Returns the number of attached runs.
+    """
+    index = readCampaignIndex()
+    if index is None:
+        return 0
+
+    dataPath = campaignStorePaths()[0]
+    attached = 0
+
+    for rotation, rotationIndex in index["rotations"].items():
+        runResults = rotationData.get(rotation)
+        if runResults is None or not runResults.useCache or runResults.rebuildCache:
+            continue
+
+        for run, entry in rotationIndex["runs"].items():
+            if run in runResults and entry["fingerprint"] == runFingerprint(runResults.runFolder(run)):
+                runResults.attachStore(run, dataPath, entry["start"], entry["stop"])
+                attached += 1
+
+    return attached
+
+def rotationRecords(rotation):
+    """
+    REQUIRES:
+    - rotation: rotation name (ex. 20120516)
+
+    EFFECTS: returns the records of all runs of the rotation as one zero-copy view into
+    the campaign store, or None if the rotation isn't stored
+    """
+    index = readCampaignIndex()
+    if index is None or rotation not in index["rotations"]:
+        return None
+
+    rotationIndex = index["rotations"][rotation]
+    return storeRecords(campaignStorePaths()[0])[rotationIndex["start"]:rotationIndex["stop"]].view(np.ndarray)
@@ -3,9 +3,12 @@ configs = {
     "simDirectory": "./simulations",
     "simParamLocation": "key_params.txt", #where sim parameter data is stored
     "simResultsLocation": "./run01/IH/trj_earth_n00005000.sat", #in folder run###_AWSoM
+    "satBlockRows": 100000, # number of .sat rows parsed at a time, bounds memory use on long trajectories
+    "simCadenceSeconds": None, # only keep the first sim row of every interval of this length (ex. 3600 = hourly OMNI cadence), None keeps all rows
 
     # where to save output data to
     "outputDataFolder": "./output_data", # where plot images should be saved
+    "outputDataFormats": ["txt"], # difference table formats to write: txt, csv, npy, parquet (requires pyarrow)
 
     #plot appearance
     "plotSimLineColor": "#0362fc", #line color of sim run results in the final plots
@@ -32,12 +35,35 @@ configs = {
 
     # scraping configs
     "varsToScrape": ["V", "N", "T", "ABS_B"], # NOTE: vars must match corresponding variables in "dataToPlot"
+    "omniCacheFolder": "omni_cache", # where scraped observations are cached, inside outputDataFolder unless absolute. None disables the on-disk cache
+    "omniCacheTTLDays": 30, # cached observations older than this are scraped again, None = never expire
+    "omniCacheMaxMB": 500, # least recently used cached observations are deleted above this size, None = unlimited
+    "omniOffline": False, # only use cached observations, never connect to CDAWeb
+    "omniMergeGapHours": 24, # observation timeframes closer than this are fetched in a single request
     
     #poynting flux vs difference from actual plot properties
     "diffPlotColor": "blue",
     "diffBestPointColor": "red",
     "diffValueBins": 7, # number of tick marks on y axis of poynting flux plot
-    "diffCalcMethod": "curve_distance"
+    "fluxFitPoints": 5, # number of simulated poynting flux values around the best one used to interpolate the optimum
+    "fluxSuggestionCount": 3, # number of poynting flux values suggested for the next simulations
+    "diffCalcMethod": "curve_distance",
+
+    # --watch mode (see sim_watcher.py)
+    "watchPollSeconds": 2, # how often the sim directory is rescanned when watchdog isn't installed
+    "watchRescanSeconds": 60, # how often it is rescanned anyway when file system events are used
+    "watchDebounceSeconds": 5, # runs are only picked up once the sim directory has been unchanged this long
+
+    # regression checks against reference difference tables (see score_validation.py)
+    "validationFolder": "./validation", # reference tables ([rotation].txt) and their recorded observations (omni/)
+    "validationMissingValue": 999, # reference values equal to this are missing and not compared
+    "validationAbsTolerance": 0.01, # a value passes if |value - reference| <= abs tolerance + rel tolerance * |reference|
+    "validationRelTolerance": 0.05,
+    "validationMaxBestRank": 1, # the reference's best poynting flux must rank at least this high (1 = same best flux)
+
+    # profiling (see profiling.py)
+    "profile": False, # write a stage timing report per rotation to outputDataFolder/profile
+    "profileStats": False # also dump cProfile stats per rotation (read with pstats)
 }
 
 #constants
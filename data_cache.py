@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import numpy as np
+from config_local import *
+from data_parser import *
+from data_utils import atomicWrite
+
+def cacheFolder():
+    """
+    EFFECTS: returns the folder where parsed sim runs are cached (inside outputDataFolder)
+    """
+    return os.path.join(configs["outputDataFolder"], "sim_cache")
+
+def fileFingerprint(path):
+    """
+    REQUIRES:
+    - path: path of an existing file
+
+    EFFECTS: returns [absolute path, mtime (ns), size] of the file, used to detect changes
+    """
+    stats = os.stat(path)
+    return [os.path.abspath(path), stats.st_mtime_ns, stats.st_size]
+
+def runFingerprint(runFolder):
+    """
+    REQUIRES:
+    - runFolder: path of a run###_AWSoM folder
+
+    EFFECTS: returns the fingerprint of the run's param and result files plus the parser version
+    and decimation cadence. A cached run is only valid while its stored fingerprint equals this one.
+    """
+    return {
+        "parserVersion": parserVersion,
+        "cadence": configs["simCadenceSeconds"],
+        "params": fileFingerprint(os.path.join(runFolder, configs["simParamLocation"])),
+        "results": fileFingerprint(os.path.join(runFolder, configs["simResultsLocation"]))
+    }
+
+def cachePaths(runFolder):
+    """
+    REQUIRES:
+    - runFolder: path of a run###_AWSoM folder
+
+    EFFECTS: returns [data path, metadata path] of the run's cache entry. The run's results are
+    stored as a .npy structured array and its params and fingerprint in a .json file next to it.
+    Names include a hash of the absolute run path so runs with the same name in different
+    sim directories don't collide.
+    """
+    runFolder = os.path.abspath(runFolder)
+    pathHash = hashlib.sha1(runFolder.encode()).hexdigest()[:12]
+    basePath = os.path.join(cacheFolder(), f"{os.path.basename(runFolder)}_{pathHash}")
+
+    return [basePath + ".npy", basePath + ".json"]
+
+def readCachedRun(runFolder, fingerprint):
+    """
+    REQUIRES:
+    - runFolder: path of a run###_AWSoM folder
+    - fingerprint: current fingerprint of the run (see runFingerprint)
+
+    EFFECTS: returns [params, RunResult] from the cache, or None if the run isn't cached
+    or the cached copy is out of date
+    """
+    dataPath, metadataPath = cachePaths(runFolder)
+
+    try:
+        with open(metadataPath, "r") as file:
+            metadata = json.load(file)
+
+        if metadata["fingerprint"] != fingerprint:
+            return None
+
+        data = np.load(dataPath, allow_pickle = False)
+    except (OSError, ValueError, KeyError):
+        # missing, unreadable or partially written cache files are treated as a cache miss
+        return None
+
+    if data.dtype != RUN_RESULT_DTYPE:
+        return None
+
+    return [metadata["params"], RunResult(data)]
+
+def writeCachedRun(runFolder, fingerprint, params, simResults):
+    """
+    REQUIRES:
+    - runFolder: path of a run###_AWSoM folder
+    - fingerprint: fingerprint of the files simResults was parsed from
+    - params, simResults: parsed run params and results
+
+    EFFECTS: saves the run to the cache. The metadata is written last, so an entry only
+    becomes valid once its data file is complete.
+    """
+    folder = cacheFolder()
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok = True)
+
+    dataPath, metadataPath = cachePaths(runFolder)
+    metadata = {"fingerprint": fingerprint, "params": params}
+
+    atomicWrite(dataPath, lambda file: np.save(file, simResults.data), "wb")
+    atomicWrite(metadataPath, lambda file: json.dump(metadata, file), "w")
+
+def loadSimRun(runFolder, useCache = True, rebuildCache = False):
+    """
+    REQUIRES:
+    - runFolder: path of a run###_AWSoM folder
+    - useCache (default = true): whether to read and write the on-disk cache
+    - rebuildCache (default = false): ignore cached copies and overwrite them with freshly parsed data
+
+    EFFECTS: returns [params, RunResult] for the run, with the run name and poynting flux set.
+    Text files are only parsed when the run is not cached or has changed since it was cached.
+    Rows are decimated to configs["simCadenceSeconds"] while parsing, if set.
+    """
+    run = os.path.basename(os.path.normpath(runFolder))
+
+    cached = None
+    if useCache:
+        fingerprint = runFingerprint(runFolder)
+        if not rebuildCache:
+            cached = readCachedRun(runFolder, fingerprint)
+
+    if cached is not None:
+        params, simResults = cached
+    else:
+        params = parseSimParams(os.path.join(runFolder, configs["simParamLocation"]))
+        simResults = parseSimRunResults(os.path.join(runFolder, configs["simResultsLocation"]), cadence = configs["simCadenceSeconds"])
+
+        if useCache:
+            writeCachedRun(runFolder, fingerprint, params, simResults)
+
+    #add run name and poynting flux as additional params to simResults
+    simResults["runName"] = run
+    simResults["poyntingFlux"] = params["PoyntingFluxPerBSi"]
+
+    return [params, simResults]
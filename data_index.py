@@ -0,0 +1,197 @@
+import os
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from config_local import *
+from data_parser import *
+from data_cache import *
+from campaign_store import storeRecords
+from profiling import stage
+
+class RotationRuns(Mapping):
+    """
+    All simulation runs of one rotation, keyed by run folder name.
+
+    Run params are known up front, but a run's results (RunResult) are only loaded from the
+    cache or parsed from its .sat file the first time that run is accessed. Runs attached to
+    the campaign store (see campaign_store) are read as zero-copy views of its memory map instead.
+    """
+
+    def __init__(self, rotation, simDirectory, useCache = True, rebuildCache = False):
+        self.rotation = rotation
+        self.simDirectory = simDirectory
+        self.useCache = useCache
+        self.rebuildCache = rebuildCache
+
+        self.runParams = dict() # run name -> params from key_params.txt, in indexing order
+        self.loadedRuns = dict() # run name -> RunResult, filled on first access
+        self.storedRuns = dict() # run name -> [campaign store data path, start, stop]
+
+    def addRun(self, run, params):
+        """
+        REQUIRES:
+        - run: run folder name (ex. run001_AWSoM)
+        - params: the run's params (see data_parser.parseSimParams)
+
+        EFFECTS: adds the run to the rotation without loading its results
+        """
+        self.runParams[run] = params
+        self.loadedRuns.pop(run, None)
+        self.storedRuns.pop(run, None)
+
+    def removeRun(self, run):
+        """
+        REQUIRES:
+        - run: name of a run in the rotation
+
+        EFFECTS: removes the run and frees its results
+        """
+        self.runParams.pop(run)
+        self.loadedRuns.pop(run, None)
+        self.storedRuns.pop(run, None)
+
+    def attachStore(self, run, dataPath, start, stop):
+        """
+        REQUIRES:
+        - run: name of a run in the rotation
+        - dataPath: data path of the campaign store holding the run (see campaign_store)
+        - start, stop: record range of the run in the store
+
+        EFFECTS: reads the run's results from the campaign store from now on
+        """
+        self.storedRuns[run] = [dataPath, start, stop]
+        self.loadedRuns.pop(run, None)
+
+    def runFolder(self, run):
+        return os.path.join(self.simDirectory, run)
+
+    def poyntingFlux(self, run):
+        return self.runParams[run]["PoyntingFluxPerBSi"]
+
+    def isLoaded(self, run):
+        return run in self.loadedRuns
+
+    def preload(self, executor = None, runs = None):
+        """
+        REQUIRES:
+        - executor (default = None): process pool to load runs on, see createIndexPool
+        - runs (default = None): names of the runs to load, or None to load all runs
+
+        EFFECTS: loads every requested run that isn't loaded yet. With an executor, runs are read/parsed
+        in its worker processes and their RunResult arrays are sent back pickled. Runs attached to
+        the campaign store are always mapped in the calling process.
+        """
+        if runs is None:
+            runs = self.runParams
+
+        runs = [run for run in runs if run not in self.loadedRuns]
+
+        if executor is None:
+            for run in runs:
+                self[run]
+            return
+
+        #runs in the campaign store are only mapped, sending them through the executor would copy them
+        for run in runs:
+            if run in self.storedRuns:
+                self[run]
+
+        runs = [run for run in runs if run not in self.storedRuns]
+
+        runFolders = [self.runFolder(run) for run in runs]
+        with stage("load"):
+            results = executor.map(loadSimRun, runFolders, [self.useCache] * len(runs), [self.rebuildCache] * len(runs))
+
+            for run, (params, simResults) in zip(runs, results):
+                self.loadedRuns[run] = simResults
+
+    def unload(self):
+        """
+        EFFECTS: frees all loaded run results, they are reloaded on next access
+        """
+        self.loadedRuns.clear()
+
+    def __getitem__(self, run):
+        if run not in self.loadedRuns:
+            if run not in self.runParams:
+                raise KeyError(run)
+
+            if run in self.storedRuns:
+                dataPath, start, stop = self.storedRuns[run]
+                self.loadedRuns[run] = RunResult(storeRecords(dataPath)[start:stop].view(np.ndarray), run, self.poyntingFlux(run))
+            else:
+                with stage("load"):
+                    self.loadedRuns[run] = loadSimRun(self.runFolder(run), self.useCache, self.rebuildCache)[1]
+
+        return self.loadedRuns[run]
+
+    def __contains__(self, run):
+        # checked against the index so membership tests don't load the run
+        return run in self.runParams
+
+    def __iter__(self):
+        return iter(self.runParams)
+
+    def __len__(self):
+        return len(self.runParams)
+
+    def __repr__(self):
+        return f"RotationRuns(rotation={self.rotation!r}, runs={len(self)}, loaded={len(self.loadedRuns)}, stored={len(self.storedRuns)})"
+
+def createIndexPool(workers):
+    """
+    REQUIRES:
+    - workers: number of worker processes
+
+    EFFECTS: returns a process pool for RotationRuns.preload, or None if workers <= 1
+    (runs are then loaded in the calling process). The pool should be reused across
+    rotations and shut down by the caller.
+    """
+    if workers <= 1:
+        return None
+
+    return ProcessPoolExecutor(max_workers = workers)
+
+def listSimFolders(simDirectory):
+    """
+    REQUIRES:
+    - simDirectory: folder containing run###_AWSoM folders
+
+    EFFECTS: returns a list of all runs' folder names
+    """
+    with os.scandir(simDirectory) as entries:
+        return [entry.name for entry in entries if entry.is_dir()]
+
+def buildRotationIndex(simDirectory, useCache = True, rebuildCache = False, workers = 1):
+    """
+    REQUIRES:
+    - simDirectory: folder containing run###_AWSoM folders
+    - useCache, rebuildCache: how run results are loaded later (see data_cache.loadSimRun)
+    - workers (default = 1): number of threads used to read the key_params.txt files
+
+    EFFECTS: returns a dict of rotation name -> RotationRuns.
+
+    Only the small key_params.txt files are read here. The .sat results of a run are
+    loaded on demand, so plotting a single rotation never touches other rotations' data.
+    """
+    rotationData = dict()
+
+    runs = listSimFolders(simDirectory)
+    paramFiles = [os.path.join(simDirectory, run, configs["simParamLocation"]) for run in runs]
+
+    #reading the param files is I/O bound, so threads are enough to overlap filesystem latency
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers = workers) as executor:
+            allParams = list(executor.map(parseSimParams, paramFiles))
+    else:
+        allParams = [parseSimParams(paramFile) for paramFile in paramFiles]
+
+    for run, params in zip(runs, allParams):
+        rotation = params["rotation"]
+
+        #add folder to its corresponding rotation name key in rotationData
+        if rotation not in rotationData:
+            rotationData[rotation] = RotationRuns(rotation, simDirectory, useCache, rebuildCache)
+
+        rotationData[rotation].addRun(run, params)
+
+    return rotationData
@@ -1,68 +1,245 @@
-from datetime import datetime
-import re
+import itertools
+import numpy as np
+from collections.abc import Mapping
 from config_local import *
 from data_utils import *
 
-def parseSimRunResults(file):
+# bump whenever the output of parseSimRunResults/parseSimParams changes, invalidates cached runs
+parserVersion = 1
+
+# column layout of the .sat trajectory files (after the 2 header lines):
+# it [year mo dy hr mn sc msc] [X Y Z] rho [ux uy uz] [bx by bz] p pe ehot I01 I02
+SAT_COLUMNS = {
+    "it": 0,
+    "time": slice(1, 8),
+    "earthCoords": slice(8, 11),
+    "rho": 11,
+    "velocityVector": slice(12, 15),
+    "magneticVector": slice(15, 18),
+    "p": 18,
+    "pe": 19,
+    "ehot": 20,
+    "I01": 21,
+    "I02": 22
+}
+
+# one record per trajectory row, see RunResult
+RUN_RESULT_DTYPE = np.dtype([
+    ("it", np.int64),
+    ("timestamp", "datetime64[ms]"),
+    ("earthCoords", np.float64, (3,)),
+    ("rho", np.float64),
+    ("velocityVector", np.float64, (3,)),
+    ("U", np.float64),
+    ("magneticVector", np.float64, (3,)),
+    ("B", np.float64),
+    ("p", np.float64),
+    ("pe", np.float64),
+    ("ehot", np.float64),
+    ("I01", np.float64),
+    ("I02", np.float64),
+    ("n", np.float64),
+    ("ti", np.float64)
+])
+
+class RunResult(Mapping):
+    """
+    Results of a single simulation run, stored as one contiguous structured array
+    (dtype RUN_RESULT_DTYPE) plus run metadata.
+
+    Supports dict-style access, so runResult["U"] returns the U column and
+    runResult["poyntingFlux"] returns the poynting flux metadata value.
+    """
+    __slots__ = ("data", "runName", "poyntingFlux")
+
+    metadataKeys = ("runName", "poyntingFlux")
+
+    def __init__(self, data, runName = None, poyntingFlux = None):
+        self.data = data
+        self.runName = runName
+        self.poyntingFlux = poyntingFlux
+
+    def __getitem__(self, key):
+        if key in self.metadataKeys:
+            return getattr(self, key)
+
+        # numpy raises ValueError for unknown fields, Mapping's `in` and .get expect KeyError
+        if key not in self.data.dtype.names:
+            raise KeyError(key)
+
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        # only metadata can be assigned, columns are read-only views of data
+        if key not in self.metadataKeys:
+            raise KeyError(f"Cannot assign column \"{key}\" of a RunResult")
+
+        setattr(self, key, value)
+
+    def __iter__(self):
+        yield from self.data.dtype.names
+        for key in self.metadataKeys:
+            if getattr(self, key) is not None:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"RunResult(runName={self.runName!r}, poyntingFlux={self.poyntingFlux!r}, rows={len(self.data)})"
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+def parseTimestamps(timeColumns):
+    """
+    REQUIRES:
+    - timeColumns: 2d float array with the columns [year mo dy hr mn sc msc]
+
+    EFFECTS: returns a datetime64[ms] array built from the time columns
+    """
+    timeColumns = timeColumns.astype(np.int64)
+    year, month, day, hour, minute, second, millisecond = timeColumns.T
+
+    timestamps = (year - 1970).astype("datetime64[Y]") + (month - 1).astype("timedelta64[M]")
+    timestamps = timestamps.astype("datetime64[D]") + (day - 1).astype("timedelta64[D]")
+
+    return (timestamps + hour.astype("timedelta64[h]") + minute.astype("timedelta64[m]")
+            + second.astype("timedelta64[s]") + millisecond.astype("timedelta64[ms]"))
+
+def satRecords(columns):
+    """
+    REQUIRES:
+    - columns: 2d float array of .sat data rows (see SAT_COLUMNS)
+
+    EFFECTS: returns the rows as a RUN_RESULT_DTYPE structured array, including the
+    derived quantities (U, B, n, ti)
+    """
+    records = np.empty(len(columns), dtype = RUN_RESULT_DTYPE)
+    records["it"] = columns[:, SAT_COLUMNS["it"]]
+    records["timestamp"] = parseTimestamps(columns[:, SAT_COLUMNS["time"]])
+
+    for key in ("earthCoords", "rho", "velocityVector", "magneticVector", "p", "pe", "ehot", "I01", "I02"):
+        records[key] = columns[:, SAT_COLUMNS[key]]
+
+    rho = records["rho"]
+    p = records["p"]
+
+    #quantity conversions
+    records["U"] = np.sqrt(np.sum(records["velocityVector"]**2, axis = 1)) #convert velocityVector to magnitudes
+    records["B"] = np.sqrt(np.sum((records["magneticVector"] * 1e5)**2, axis = 1)) #convert magneticVector to magnitudes, then from microtesla (assumed) to nT
+    records["n"] = rho / protonMass #rho/protonMass
+    records["ti"] = p * protonMass / rho / k * 1.e-7
+
+    return records
+
+def iterSimRunBlocks(file, blockRows = None, startTime = None, endTime = None, cadence = None):
+    """
+    REQUIRES:
+    - file: string where sim run data is stored
+    - blockRows (default = configs["satBlockRows"]): number of file rows parsed at a time
+    - startTime, endTime (default = None): only keep rows inside [startTime, endTime]
+    (datetime64 or '%Y-%m-%d %H:%M:%S' strings), None leaves that side unbounded
+    - cadence (default = None): if given, only keep the first row of every cadence seconds (ex. 3600 for hourly)
+
+    EFFECTS: yields the file's rows as RUN_RESULT_DTYPE structured arrays of at most blockRows records,
+    so only one block of text is held in memory at a time. Blocks left empty by the filters are skipped.
+
+    NOTE: rows are assumed to be in time order, reading stops at the first row past endTime
+    """
+    if blockRows is None:
+        blockRows = configs["satBlockRows"]
+
+    if startTime is not None:
+        startTime = np.datetime64(startTime, "ms")
+    if endTime is not None:
+        endTime = np.datetime64(endTime, "ms")
+
+    lastBin = None
+
+    with open(file, "r") as satFile:
+        #skips the first 2 lines which are headers
+        for _ in range(2):
+            satFile.readline()
+
+        while True:
+            lines = list(itertools.islice(satFile, blockRows))
+            if len(lines) == 0:
+                return
+
+            columns = np.loadtxt(lines, ndmin = 2)
+            if len(columns) == 0:
+                continue
+
+            records = satRecords(columns)
+            timestamps = records["timestamp"]
+            pastEnd = endTime is not None and timestamps[-1] > endTime
+
+            if startTime is not None or endTime is not None:
+                inWindow = np.ones(len(records), dtype = bool)
+                if startTime is not None:
+                    inWindow &= timestamps >= startTime
+                if endTime is not None:
+                    inWindow &= timestamps <= endTime
+
+                records = records[inWindow]
+
+            #keeps the first row of each cadence interval, carrying the last interval over between blocks
+            if cadence is not None and len(records) > 0:
+                bins = records["timestamp"].astype("datetime64[s]").astype(np.int64) // int(cadence)
+
+                keep = np.empty(len(records), dtype = bool)
+                keep[0] = bins[0] != lastBin
+                keep[1:] = bins[1:] != bins[:-1]
+                lastBin = bins[-1]
+
+                records = records[keep]
+
+            if len(records) > 0:
+                yield records
+
+            if pastEnd:
+                return
+
+def parseSimRunResults(file, startTime = None, endTime = None, cadence = None):
     """
     REQUIRES:
     - file: string where sim run data is stored
+    - startTime, endTime, cadence (default = None): optional time window and decimation, see iterSimRunBlocks
+
+    EFFECTS: returns run results from rotation as a RunResult
+    - Key = file header variables, value = numpy array of all values for that variable
+    - Vector quantities (earthCoords, velocityVector, magneticVector) are (rows, 3) arrays
+    - timestamp is a datetime64[ms] array
+
+    The file is parsed in blocks (see iterSimRunBlocks), so apart from the result only
+    one block is held in memory at a time
+    """
+    blocks = list(iterSimRunBlocks(file, startTime = startTime, endTime = endTime, cadence = cadence))
+
+    if len(blocks) == 0:
+        return RunResult(np.empty(0, dtype = RUN_RESULT_DTYPE))
+
+    return RunResult(np.concatenate(blocks))
+
+def parseSimParams(file):
+    """
+    REQUIRES:
+    - file: string where the sim run parameters (key_params.txt) are stored
 
-    EFFECTS: returns run results from rotation as a sorted dict
-    - Key = file header variables, value = array of all values for that variable
+    EFFECTS: returns the run parameters as a dict of strings
+    - param structure: model, map, PoyntingFluxPerBSi, realizations
+    - an additional "rotation" key holds the rotation name taken from the map (ex. 20110201)
     """
+    params = {}
 
-    runResults = {
-        "it": [],
-        "timestamp": [],
-        "earthCoords": [],
-        "rho": [],
-        "velocityVector": [],
-        "U": [],
-        "magneticVector": [],
-        "B": [],
-        "p": [],
-        "pe": [],
-        "ehot": [],
-        "I01": [],
-        "I02": [],
-        "n": [],
-        "ti": []
-    }
-
-    #read the input data file line by line
     with open(file, "r") as file:
-        fileContents = file.readlines()
-
-        for i, line in enumerate(fileContents):
-            if i >= 2: #ignore first 2 lines which are headers
-                row = line.strip()
-                row = re.sub(r'\s+', ' ', row)
-                row = row.split(" ")
-
-                #it [year mo dy hr mn sc msc] [X Y Z] rho [ux uy uz] [bx by bz] p pe ehot I01 I02
-                runResults["it"].append(row[0])
-                timestampStr = " ".join(row[1:8])
-                timestamp = datetime.strptime(timestampStr, '%Y %m %d %H %M %S %f')
-                runResults["timestamp"].append(timestamp)
-                runResults["earthCoords"].append(row[8:11])
-                runResults["rho"].append(row[11])
-                runResults["velocityVector"].append(row[12:15])
-                runResults["magneticVector"].append(row[15:18])
-                runResults["p"].append(row[18])
-                runResults["pe"].append(row[19])
-                runResults["ehot"].append(row[20])
-                runResults["I01"].append(row[21])
-                runResults["I02"].append(row[22])
-                
-                #runResults["P=poyntingFlux"].append()
-
-                #quantity conversions
-                rho = float(row[11])
-                p = float(row[18])
-                runResults["U"].append(magnitude(row[12:15])) #convert velocityVector to magnitudes
-                runResults["B"].append(magnitude(multiplyArr(row[15:18], 1e5))) #convert magneticVector to magnitudes, then from microtesla (assumed) to nT
-                runResults["n"].append(rho / protonMass) #rho/protonMass
-                runResults["ti"].append(p * protonMass / rho / k * 1.e-7) #rho/protonMass
-
-    return runResults
\ No newline at end of file
+        for line in file.readlines():
+            key, value = line.strip().split("=")
+            params[key.strip()] = value.strip()
+
+    #gets rotation name from params list
+    params["rotation"] = params["map"].split("/")[1].split("_")[1]
+
+    return params
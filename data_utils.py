@@ -1,10 +1,16 @@
+import csv
 import math
+import os
+import tempfile
 import numpy as np
 from config_local import *
-from scipy.stats import spearmanr
-from scipy.integrate import simpson
-from scipy.spatial.distance import cdist
-from scipy.interpolate import interp1d
+from profiling import timedStage
+from ranking import *
+
+# NOTE: scipy takes most of the program's import time, so it is only imported by the functions that need it
+
+# bump whenever the output of difference_sim_obs/difference_matrix (or curveDistance) changes, invalidates stored scores
+scoreVersion = 1
 
 def magnitude(arr):
     """
@@ -28,44 +34,121 @@ def multiplyArr(arr, constant):
 
     return arr
 
+def atomicWrite(path, writeFunction, mode):
+    """
+    REQUIRES:
+    - path: file to write
+    - writeFunction: function that writes the contents to the file object it is given
+    - mode: file mode to open the temp file with ("w" or "wb")
+
+    EFFECTS: writes to a temp file in the same folder, then renames it over path, so
+    concurrent readers never see a partially written file
+    """
+    fileDescriptor, tempPath = tempfile.mkstemp(dir = os.path.dirname(path), suffix = ".tmp")
+    try:
+        with os.fdopen(fileDescriptor, mode) as file:
+            writeFunction(file)
+        os.replace(tempPath, path)
+    except BaseException:
+        os.remove(tempPath)
+        raise
+
+@timedStage("timestampConversion")
+def toEpochSeconds(timestamps):
+    """
+    REQUIRES:
+    - timestamps: datetime64 array (any unit), naive times are treated as UTC
+
+    EFFECTS: returns the timestamps as int64 seconds since the epoch (1970-01-01 UTC),
+    subsecond precision is dropped
+    """
+    return np.asarray(timestamps).astype("datetime64[s]").astype(np.int64)
+
+def formatTimestamp(timestamp):
+    """
+    REQUIRES:
+    - timestamp: datetime64 value
+
+    EFFECTS: returns the timestamp as a '%Y-%m-%d %H:%M:%S' string, subsecond precision is dropped
+    """
+    return np.datetime_as_string(np.datetime64(timestamp, "s")).replace("T", " ")
+
 class datafile:
     """
     Manages output file generation. Output files include rows of data (usually differences)
+
+    Rows are buffered in memory and written in one go by close(), through a temp file that is
+    renamed into place. The .txt layout is tab separated with one row per line. Other formats
+    listed in configs["outputDataFormats"] are written next to it:
+    - csv: comma separated copy of the table
+    - npy: structured array, one float field per column (named after the header row)
+    - parquet: Parquet table (requires pyarrow)
     """
     rotationFile = ""
     
-    def __init__(self, rotationFile):
+    def __init__(self, rotationFile, formats = None):
         self.rotationFile = configs["outputDataFolder"] + "/" + rotationFile
+        self.formats = configs["outputDataFormats"] if formats is None else formats
         self.clear()
     
     def clear(self):
-        with open(self.rotationFile + '.txt', 'w') as file:
-            pass
+        self.rows = [[]]
 
     def add(self, content):
-        with open(self.rotationFile + '.txt', 'a') as file:
-            file.write(str(content) + "\t")
+        self.rows[-1].append(str(content))
             
     def newLine(self):
-        with open(self.rotationFile + '.txt', 'rb+') as file:
-            file.seek(0, 2)
-            if file.tell() == 0:
-                return
-            file.seek(-1, 2)
-            if file.read(1) == b'\t':
-                file.seek(-1, 2)
-                file.truncate()
-                file.write(b'\n')
-    
+        # like a trailing tab, an empty row is never ended
+        if len(self.rows[-1]) > 0:
+            self.rows.append([])
+
+    def text(self):
+        """
+        EFFECTS: returns the buffered rows in the .txt layout
+        """
+        return "\n".join("\t".join(row) for row in self.rows)
+
+    def table(self):
+        """
+        EFFECTS: returns the buffered rows as a list of rows of cells, a cell added with tabs
+        in it (ex. the header) is split into separate cells
+        """
+        return ["\t".join(row).split("\t") for row in self.rows if len(row) > 0]
+
     def close(self):
-        with open(self.rotationFile + '.txt', 'rb+') as file:
-            file.seek(0, 2)
-            if file.tell() == 0:
-                return
-            file.seek(-1, 2)
-            if file.read(1) == b'\t' or file.read(1) == b'\n':
-                file.seek(-1, 2)
-                file.truncate()
+        atomicWrite(self.rotationFile + ".txt", lambda file: file.write(self.text()), "w")
+
+        for fileFormat in self.formats:
+            if fileFormat == "txt":
+                continue
+            elif fileFormat == "csv":
+                atomicWrite(self.rotationFile + ".csv", lambda file: csv.writer(file, lineterminator = "\n").writerows(self.table()), "w")
+            elif fileFormat == "npy":
+                atomicWrite(self.rotationFile + ".npy", lambda file: np.save(file, self.structuredArray()), "wb")
+            elif fileFormat == "parquet":
+                self.writeParquet(self.rotationFile + ".parquet")
+            else:
+                raise ValueError(f"Unknown output data format \"{fileFormat}\"")
+
+    def structuredArray(self):
+        """
+        EFFECTS: returns the table as a structured array, the first row is used as field names
+        """
+        header, *rows = self.table()
+        dtype = [(name, np.float64) for name in header]
+
+        return np.array([tuple(float(cell) for cell in row) for row in rows], dtype = dtype)
+
+    def writeParquet(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Writing Parquet output requires pyarrow (pip install pyarrow)")
+
+        data = self.structuredArray()
+        table = pyarrow.table({name: data[name] for name in data.dtype.names})
+        atomicWrite(path, lambda file: pyarrow.parquet.write_table(table, file), "wb")
 
 def difference_sim_obs(simTimestamps, simValues, dataTimestamps, dataValues, method):
     """
@@ -105,61 +188,181 @@ def difference_sim_obs(simTimestamps, simValues, dataTimestamps, dataValues, met
         return mse
     elif method == "scc":
         # spearman correlation coefficient
+        from scipy.stats import spearmanr
         scc, pvalue = spearmanr(dataValues, interpSimValues)
         
         return scc
     elif method == "curve_distance":
-        def curveDist(x1, y1, x2, y2):
-            # normalization factors
-            # 1 is observation, 2 is simulation
-            # 10 days in epoch time is 10.*24*3600
-            X = 10.*24*3600
-            # Normalization for OMNI data
-            Y = max(y1) - min(y1)
-            
-            x1_normalized = np.array(x1) / X
-            x2_normalized = np.array(x2) / X
-            y1_normalized = np.array(y1) / Y
-            y2_normalized = np.array(y2) / Y
+        return curveDistance(dataTimestamps, dataValues, simTimestamps, simValues)
+    else:
+        # mean squared error
+        n = len(dataTimestamps)
+        squaredDiff = [(actual - predicted)**2 for actual, predicted in zip(dataValues, interpSimValues)]
+        mse = sum(squaredDiff) / n
 
-            n1 = len(x1)
-            n2 = len(x2)
-            d1=0
-            d2=0
+        return mse
 
-            x1c = np.add(x1_normalized[1:n1],x1_normalized[0:n1-1])/2
-            x2c = np.add(x2_normalized[1:n2],x2_normalized[0:n2-1])/2
-            y1c = np.add(y1_normalized[1:n1],y1_normalized[0:n1-1])/2
-            y2c = np.add(y2_normalized[1:n2],y2_normalized[0:n2-1])/2
+def curveSegments(x, y, X, Y):
+    """
+    REQUIRES:
+    - x, y: curve points
+    - X, Y: normalization factors for x and y
 
-            x1c = np.array(x1c)
-            x2c = np.array(x2c)
-            y1c = np.array(y1c)
-            y2c = np.array(y2c)
+    EFFECTS: returns [midpoints, lengths] of the normalized curve's segments,
+    midpoints is a (n - 1, 2) array
+    """
+    xNormalized = np.asarray(x, dtype = np.float64) / X
+    yNormalized = np.asarray(y, dtype = np.float64) / Y
 
-            d1c = np.sqrt( (x1_normalized[1:n1] - x1_normalized[0:n1-1])**2 + (y1_normalized[1:n1] - y1_normalized[0:n1-1])**2 )
-            d2c = np.sqrt( (x2_normalized[1:n2] - x2_normalized[0:n2-1])**2 + (y2_normalized[1:n2] - y2_normalized[0:n2-1])**2 )  
+    midpoints = np.column_stack(((xNormalized[1:] + xNormalized[:-1])/2, (yNormalized[1:] + yNormalized[:-1])/2))
+    lengths = np.sqrt(np.diff(xNormalized)**2 + np.diff(yNormalized)**2)
 
-            len1 = np.sum(d1c)
-            len2 = np.sum(d2c)
+    return [midpoints, lengths]
 
-            for i in range(0, n1-1):
-                d1 = d1 + d1c[i]*np.min( np.sqrt( (x1c[i] - x2c)**2 + (y1c[i] - y2c)**2 ) )
-            for i in range(0, n2-1):
-                d2 = d2 + d2c[i]*np.min( np.sqrt( (x2c[i] - x1c)**2 + (y2c[i] - y1c)**2 ) )
+def observationCurve(x, y):
+    """
+    REQUIRES:
+    - x, y: observation curve (timestamps in int format, values)
 
-            d = (d1/len1 + d2/len2)/2
+    EFFECTS: returns [midpoints, lengths, KD-tree of the midpoints, X, Y] of the observation curve,
+    where X and Y are the normalization factors of both curves (see curveDistance)
+    """
+    from scipy.spatial import cKDTree
 
-            return d
+    # normalization factors
+    # 10 days in epoch time is 10.*24*3600
+    X = 10.*24*3600
+    # Normalization for OMNI data
+    Y = np.max(y) - np.min(y)
 
-        return curveDist(dataTimestamps, dataValues, simTimestamps, simValues)
-    else:
-        # mean squared error
-        n = len(dataTimestamps)
-        squaredDiff = [(actual - predicted)**2 for actual, predicted in zip(dataValues, interpSimValues)]
-        mse = sum(squaredDiff) / n
+    midpoints, lengths = curveSegments(x, y, X, Y)
+    return [midpoints, lengths, cKDTree(midpoints), X, Y]
 
-        return mse
+def curveDistance(x1, y1, x2, y2, obsCurve = None):
+    """
+    REQUIRES:
+    - x1, y1: observation curve (timestamps in int format, values)
+    - x2, y2: simulation curve (timestamps in int format, values)
+    - obsCurve (optional): the observation curve preprocessed by observationCurve, used to score
+      many simulation curves against the same observations (see difference_matrix)
+
+    EFFECTS: returns the curve distance between the two curves. For each segment of a curve, the
+    distance from its midpoint to the nearest segment midpoint of the other curve is weighted by
+    the segment's length; the result is the average of both curves' length-weighted mean distances.
+
+    Nearest midpoints are found with a KD-tree on each curve, O((n1 + n2) log(n1 + n2)).
+    """
+    from scipy.spatial import cKDTree
+
+    # 1 is observation, 2 is simulation, both are normalized by the observation's factors
+    if obsCurve is None:
+        obsCurve = observationCurve(x1, y1)
+
+    c1, d1c, tree1, X, Y = obsCurve
+    c2, d2c = curveSegments(x2, y2, X, Y)
+
+    # distance from each midpoint to the nearest midpoint of the other curve
+    nearest1, _ = cKDTree(c2).query(c1)
+    nearest2, _ = tree1.query(c2)
+
+    d1 = np.sum(d1c * nearest1)
+    d2 = np.sum(d2c * nearest2)
+
+    d = (d1/np.sum(d1c) + d2/np.sum(d2c))/2
+
+    return d
+
+@timedStage("difference")
+def difference_matrix(simTimestamps, simValues, dataTimestamps, dataValues, method):
+    """
+    Calculates the difference between many sim runs and the same observations for several variables
+    at once. Equivalent to calling difference_sim_obs for every (run, variable) pair, but the
+    observation NaN masks, array conversions and curve distance preprocessing happen once per variable
+    and all runs are interpolated onto the observations together.
+
+    NOTE: timestamps must be converted to int format
+
+    REQUIRES:
+    - simTimestamps: R arrays of simulation timestamps, one per run (runs may differ in length)
+    - simValues: R arrays of shape (V, T), the simulation values of each variable for every run
+    - dataTimestamps: array with data timestamps, shared by all variables
+    - dataValues: array of shape (V, len(dataTimestamps)) with data values, NaN where missing
+    - method: method to use (see difference_sim_obs)
+
+    EFFECTS: returns an (R, V) array, item [r, v] is the difference of run r for variable v
+    """
+    dataTimestamps = np.asarray(dataTimestamps, dtype = np.float64)
+    dataValues = np.asarray(dataValues, dtype = np.float64)
+    simTimestamps = [np.asarray(timestamps, dtype = np.float64) for timestamps in simTimestamps]
+    simValues = [np.asarray(values, dtype = np.float64) for values in simValues]
+
+    numRuns = len(simTimestamps)
+    numVars = len(dataValues)
+    differences = np.empty((numRuns, numVars))
+
+    for v in range(numVars):
+        # removes all timestamps with no observation data (NaN)
+        nanMask = ~np.isnan(dataValues[v])
+        varTimestamps = dataTimestamps[nanMask]
+        varValues = dataValues[v][nanMask]
+
+        if method == "curve_distance":
+            obsCurve = observationCurve(varTimestamps, varValues)
+
+            for r in range(numRuns):
+                differences[r, v] = curveDistance(varTimestamps, varValues, simTimestamps[r], simValues[r][v], obsCurve)
+            continue
+
+        interpSimValues = interpolateRuns(varTimestamps, simTimestamps, [values[v] for values in simValues])
+
+        if method == "mae":
+            # mean absolute error
+            differences[:, v] = np.mean(np.abs(varValues - interpSimValues), axis = 1)
+        elif method == "scc":
+            # spearman correlation coefficient, the pearson correlation of the ranks
+            from scipy.stats import rankdata
+            dataRanks = rankdata(varValues)
+            dataRanks -= np.mean(dataRanks)
+            simRanks = rankdata(interpSimValues, axis = 1)
+            simRanks -= np.mean(simRanks, axis = 1, keepdims = True)
+
+            with np.errstate(divide = "ignore", invalid = "ignore"):
+                scc = (simRanks @ dataRanks) / np.sqrt(np.sum(simRanks**2, axis = 1) * np.sum(dataRanks**2))
+
+            differences[:, v] = np.clip(scc, -1, 1)
+        else:
+            # mean squared error
+            differences[:, v] = np.mean((varValues - interpSimValues)**2, axis = 1)
+
+    return differences
+
+def interpolateRuns(x1, x2s, y2s):
+    """
+    REQUIRES:
+    - x1: x axis to interpolate onto
+    - x2s, y2s: R datasets to interpolate, each with increasing x values
+
+    EFFECTS: interpolates every dataset onto x1 (same results as interpolate), returns an (R, len(x1)) array.
+    When all datasets share the same x values, the interpolation weights are computed once for all of them.
+    """
+    if len(x2s) == 0:
+        return np.empty((0, len(x1)))
+
+    x2 = x2s[0]
+    sharedX = len(x2) > 1 and np.all(np.diff(x2) > 0) and all(np.array_equal(x2, other) for other in x2s[1:])
+
+    if not sharedX:
+        return np.array([interpolate(x1, x2, y2) for x2, y2 in zip(x2s, y2s)])
+
+    # index of the right end of the segment containing each x1 value, values
+    # outside of x2 are clamped to the first/last value like np.interp
+    right = np.clip(np.searchsorted(x2, x1, side = "right"), 1, len(x2) - 1)
+    left = right - 1
+    weights = np.clip((x1 - x2[left]) / (x2[right] - x2[left]), 0, 1)
+
+    y2s = np.asarray(y2s, dtype = np.float64)
+
+    return y2s[:, left] + (y2s[:, right] - y2s[:, left]) * weights
 
 def interpolate(x1, x2, y2):
     """
@@ -180,54 +383,23 @@ def findPlotOpacities(arr):
 
     EFFECTS: interpolates min and max values to assign opacity values to each arr item. The opacity range is 
     specified in config_local, and the min and max values will be assigned to the min and max values in the arr.
+    See ranking.scoreOpacities for a whole score matrix.
     """
-    arr = np.array(arr)
-
-    # replace nan with negative inf
-    arr[np.isnan(arr)] = -np.inf
-
-    # get indices that would sort the array
-    if configs["diffCalcMethod"] == "scc": # spearman cc has highest rank when closest to 1/-1
-        arr = 1 - np.abs(arr)
-
-    sorted_indices = np.argsort(arr)
-
-    # create array of ranks based on the sorted indices
-    ranks = np.empty_like(sorted_indices)
-    ranks[sorted_indices] = np.arange(1, len(arr) + 1)
-
-    # make nan values last place
-    ranks[arr == -np.inf] = np.max(ranks) + 1
-
-    # get opacity range
-    minOpacity = configs["simLineOpacityRange"][0]
-    maxOpacity = configs["simLineOpacityRange"][1]
-
-    # calculate difference in opacity between 2 ranks
-    opacityStep = (maxOpacity - minOpacity) / (np.max(ranks - 1))
-
-    opacities = []
-
-    # calculate individual opacities
-    for rank in ranks:
-        opacities.append(maxOpacity - opacityStep * (rank - 1))
-
-    return opacities
+    return list(scoreOpacities(np.asarray(arr, dtype = np.float64)[:, None], configs["diffCalcMethod"])[:, 0])
 
 def normalizeData(data):
     """
     REQUIRES:
     - data: input data
 
-    EFFECTS: Normalizes each value in data as a proportion of the max value
+    EFFECTS: Normalizes each value in data as a proportion of the max value.
+    See ranking.normalizeScores for a whole score matrix.
     """
-    if configs["diffCalcMethod"] == "scc" or configs["diffCalcMethod"] == "curve_distance": # spearman cc should NOT be normalized
+    method = configs["diffCalcMethod"]
+    if method == "scc" or method == "curve_distance": # spearman cc should NOT be normalized
         return data
-    
-    minValue = min(data)
-    maxValue = max(data)
-    
-    return [(x - minValue) / (maxValue - minValue) for x in data]
+
+    return list(normalizeScores(np.asarray(data, dtype = np.float64)[:, None], method)[:, 0])
 
 def calculate2DArrayAverage(arr):
     """
@@ -235,35 +407,19 @@ def calculate2DArrayAverage(arr):
     - arr: input 2d array
     Nested arrays MUST be of equal length!
 
-    EFFECTS: Averages all nested arrays in arr to form a single array
+    EFFECTS: Averages all nested arrays in arr to form a single array.
+    See ranking.averageScores for a whole score matrix.
     """
-    numRows = len(arr)
-    numCols = len(arr[0])
-    
-    if configs["diffCalcMethod"] == "scc": # normalizes spearman cc so best has lowest val and worst has highest
-        arr =  1 - np.abs(arr)
-
-    averages = [0] * numCols
-
-    for col in range(numCols):
-        colSum = sum(row[col] for row in arr)
-        averages[col] = colSum / numRows
-
-    return averages
+    return list(averageScores(np.asarray(arr, dtype = np.float64).T, configs["diffCalcMethod"]))
 
 def indexOfMinValue(arr):
     """
     REQUIRES:
     - arr: input array
 
-    EFFECTS: Returns index of min value in array
+    EFFECTS: Returns index of min value in array (nan values are skipped)
     """
-    if configs["diffCalcMethod"] == "scc": # normalizes spearman cc so best has lowest val and worst has highest
-        arr = [1 - abs(val) for val in arr]
-        
-    minVal = min(arr)
-    minIndex = arr.index(minVal)
-    return minIndex
+    return bestScoreIndex(arr, configs["diffCalcMethod"])
 
 def filterDatasetByVarName(dataset, variables, varsToKeep):
     """
@@ -0,0 +1,127 @@
+from config_local import *
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# template class -> [configs signature, template], reused across rotations within a process
+cachedTemplates = dict()
+
+class FigureTemplate:
+    """
+    A figure whose subplots are set up once (see setup) and whose artists are refilled for
+    every rotation (see update). Figures are rendered with their own Agg canvas, without
+    pyplot. Interactive templates (for -showplot) are created with pyplot so they can be shown.
+    """
+
+    def __init__(self, interactive = False):
+        self.interactive = interactive
+
+        if interactive:
+            import matplotlib.pyplot as plt
+            self.figure = plt.figure(figsize = configs["plotDimensions"])
+        else:
+            self.figure = Figure(figsize = configs["plotDimensions"])
+            FigureCanvasAgg(self.figure)
+
+        self.setup()
+
+    @staticmethod
+    def signature():
+        """
+        EFFECTS: returns the configs the template's setup depends on, a cached template is only
+        reused while these are unchanged
+        """
+        return (tuple(configs["plotDimensions"]),)
+
+    def setup(self):
+        """
+        EFFECTS: creates the template's subplots and artists
+        """
+        raise NotImplementedError
+
+    def show(self):
+        """
+        EFFECTS: opens the figure in a new window (interactive templates only)
+        """
+        import matplotlib.pyplot as plt
+        plt.show()
+
+    def save(self, path):
+        """
+        REQUIRES:
+        - path: image file to write
+
+        EFFECTS: renders the figure to path at 300 dpi
+        """
+        self.figure.savefig(path, dpi = 300)
+
+    def close(self):
+        """
+        EFFECTS: releases an interactive template's pyplot figure, other templates stay cached
+        """
+        if self.interactive:
+            import matplotlib.pyplot as plt
+            plt.close(self.figure)
+
+def reusableFigure(templateClass, interactive = False):
+    """
+    REQUIRES:
+    - templateClass: FigureTemplate subclass
+    - interactive (default = false): whether the figure will be shown in a window
+
+    EFFECTS: returns a template of the given class. Non-interactive templates are created once per
+    process (or again when the configs they depend on change) and reused, interactive ones are
+    always created new.
+    """
+    if interactive:
+        return templateClass(interactive = True)
+
+    signature = templateClass.signature()
+    cached = cachedTemplates.get(templateClass)
+    if cached is None or cached[0] != signature:
+        cached = [signature, templateClass()]
+        cachedTemplates[templateClass] = cached
+
+    return cached[1]
+
+def joinLines(xs, ys):
+    """
+    REQUIRES:
+    - xs, ys: lists of x and y arrays, one pair per line
+
+    EFFECTS: returns [x, y] of all lines joined into one, separated by nan so they are drawn unconnected
+    """
+    if len(xs) == 0:
+        return [[], []]
+
+    x = []
+    y = []
+    for lineX, lineY in zip(xs, ys):
+        if len(x) > 0:
+            x.append([np.nan])
+            y.append([np.nan])
+
+        x.append(np.asarray(lineX, dtype = float))
+        y.append(np.asarray(lineY, dtype = float))
+
+    return [np.concatenate(x), np.concatenate(y)]
+
+def autoscaleY(ax, collections = ()):
+    """
+    REQUIRES:
+    - ax: axes whose artists were updated
+    - collections (default = none): collections on ax, which Axes.relim doesn't take into account
+
+    EFFECTS: recalculates the data limits of ax and autoscales its y axis to them, the x axis is left as set
+    """
+    ax.relim()
+
+    for collection in collections:
+        dataLimits = collection.get_datalim(ax.transData)
+        points = dataLimits.get_points()
+        if not np.isinf(dataLimits.minpos).all():
+            points = np.concatenate([points, [dataLimits.minpos]])
+        ax.update_datalim(points)
+
+    ax.set_autoscaley_on(True)
+    ax.autoscale_view(scalex = False)
@@ -0,0 +1,174 @@
+import os
+import json
+import numpy as np
+from config_local import *
+from data_utils import atomicWrite
+
+def significantFigures(value, figures = 3):
+    """
+    REQUIRES:
+    - value: number
+
+    EFFECTS: returns value rounded to the given number of significant figures
+    """
+    return float(f"{value:.{figures}g}")
+
+def finiteOrNone(value):
+    """
+    REQUIRES:
+    - value: number, or list/dict of them (nested)
+
+    EFFECTS: returns value with every non-finite float (nan, inf) replaced with None, as they aren't valid JSON
+    """
+    if isinstance(value, dict):
+        return {key: finiteOrNone(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [finiteOrNone(item) for item in value]
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+
+    return value
+
+def fitOptimalFlux(poyntingFluxes, diffAverages, bestFlux = None):
+    """
+    REQUIRES:
+    - poyntingFluxes, diffAverages: arrays of equal length, the poynting flux and average difference
+    value (lower is better, see ranking.averageScores) of each run of a rotation
+    - bestFlux (default = the flux with the lowest mean difference): poynting flux of the overall best run
+    (see ranking.rankRuns), so the fit is centered on the same run as the table and plots
+
+    EFFECTS: fits a quadratic of average difference vs poynting flux around the best simulated flux
+    (over configs["fluxFitPoints"] neighbouring flux values, runs with the same flux are all used)
+    and returns a dict with:
+    - bestFlux: the best simulated flux
+    - optimum: interpolated best poynting flux, or the best simulated flux if the minimum isn't bracketed
+    - uncertainty: 1 sigma uncertainty of optimum from the fit covariance, nan if it can't be estimated
+    - bracketed: whether the fitted minimum lies between simulated fluxes
+    - convex: whether the fitted quadratic has a minimum, false if there was no fit
+    - edge: whether the best simulated flux is the lowest or highest simulated flux
+    - suggestions: the next configs["fluxSuggestionCount"] poynting flux values to simulate, around the
+    optimum if it is bracketed, continuing the sweep past the best simulated flux if it is at the edge,
+    otherwise halfway to the simulated fluxes on both sides of it
+    - curve: [fluxes, values] of the fitted quadratic over the fitted flux range, empty if there was no fit
+    """
+    fluxes = np.asarray(poyntingFluxes, dtype = float)
+    values = np.asarray(diffAverages, dtype = float)
+
+    # runs without a valid difference value can't be fitted
+    valid = np.isfinite(fluxes) & np.isfinite(values)
+    fluxes = fluxes[valid]
+    values = values[valid]
+
+    fit = {"bestFlux": np.nan, "optimum": np.nan, "uncertainty": np.nan, "bracketed": False, "convex": False, "edge": True, "suggestions": [], "curve": []}
+    if len(fluxes) == 0:
+        return fit
+
+    # realizations of the same flux are averaged to find the best simulated flux
+    uniqueFluxes, inverse = np.unique(fluxes, return_inverse = True)
+    meanValues = np.bincount(inverse, weights = values) / np.bincount(inverse)
+    if bestFlux is None or not np.any(uniqueFluxes == bestFlux):
+        bestIndex = int(np.argmin(meanValues))
+    else:
+        bestIndex = int(np.flatnonzero(uniqueFluxes == bestFlux)[0])
+    bestFlux = uniqueFluxes[bestIndex]
+
+    fit["bestFlux"] = float(bestFlux)
+    fit["optimum"] = float(bestFlux)
+    fit["edge"] = bestIndex == 0 or bestIndex == len(uniqueFluxes) - 1
+    suggestionCount = configs["fluxSuggestionCount"]
+
+    if len(uniqueFluxes) < 2:
+        return fit
+
+    fitPoints = min(max(configs["fluxFitPoints"], 3), len(uniqueFluxes))
+    start = min(max(bestIndex - fitPoints // 2, 0), len(uniqueFluxes) - fitPoints)
+    windowFluxes = uniqueFluxes[start:start + fitPoints]
+
+    # fit in units of the sweep step around the best flux to keep the fit well conditioned
+    step = float(np.median(np.diff(windowFluxes)))
+    inWindow = (fluxes >= windowFluxes[0]) & (fluxes <= windowFluxes[-1])
+    x = (fluxes[inWindow] - bestFlux) / step
+    y = values[inWindow]
+
+    a = 0
+    if len(windowFluxes) >= 3:
+        # the covariance can only be scaled by the residuals with more points than coefficients
+        if len(x) > 3:
+            (a, b, c), covariance = np.polyfit(x, y, 2, cov = True)
+        else:
+            a, b, c = np.polyfit(x, y, 2)
+            covariance = np.full((3, 3), np.nan)
+
+        curveX = np.linspace(x.min(), x.max(), 50)
+        fit["curve"] = [list(bestFlux + curveX * step), list(np.polyval([a, b, c], curveX))]
+
+    fit["convex"] = bool(a > 0)
+
+    # the minimum is only trusted between simulated fluxes, with simulated fluxes on both sides of the best one
+    if fit["convex"] and not fit["edge"]:
+        optimumX = -b / (2 * a)
+
+        if x.min() <= optimumX <= x.max():
+            # delta method, gradient of -b / 2a with respect to (a, b)
+            gradient = np.array([b / (2 * a**2), -1 / (2 * a)])
+            variance = gradient @ covariance[:2, :2] @ gradient
+
+            fit["optimum"] = float(bestFlux + optimumX * step)
+            fit["uncertainty"] = float(np.sqrt(variance) * step) if variance >= 0 else np.nan
+            fit["bracketed"] = True
+
+    if fit["bracketed"]:
+        # samples the optimum and both sides of it, at most half a sweep step apart
+        spacing = step / 2
+        if np.isfinite(fit["uncertainty"]) and fit["uncertainty"] > 0:
+            spacing = min(fit["uncertainty"], spacing)
+
+        offsets = sorted(range(-suggestionCount, suggestionCount + 1), key = abs)[:suggestionCount] # 0, -1, 1, -2, ...
+        candidates = [fit["optimum"] + offset * spacing for offset in offsets]
+    elif fit["edge"]:
+        # the best run is at the edge of the sweep, continue the sweep in that direction
+        direction = -1 if bestIndex == 0 else 1
+        candidates = [bestFlux + direction * step * (i + 1) for i in range(suggestionCount)]
+    else:
+        # the best run is inside the sweep but the fit has no minimum there (ex. noisy values), refine the sweep around it
+        candidates = [(uniqueFluxes[bestIndex - 1] + bestFlux) / 2, (bestFlux + uniqueFluxes[bestIndex + 1]) / 2][:suggestionCount]
+
+    # skips values that were already simulated or aren't physical
+    for candidate in candidates:
+        if candidate > 0 and np.min(np.abs(uniqueFluxes - candidate)) > 0.01 * step:
+            fit["suggestions"].append(significantFigures(candidate))
+
+    return fit
+
+def fluxFitSummary(fit):
+    """
+    REQUIRES:
+    - fit: result of fitOptimalFlux
+
+    EFFECTS: returns a one line description of the fit
+    """
+    if fit["bracketed"]:
+        summary = f"Interpolated best poyntingFlux: {fit['optimum']:.3e} +/- {fit['uncertainty']:.1e}"
+    elif not fit["edge"] and not fit["convex"]:
+        summary = f"Best poyntingFlux fit is not convex (best simulated: {fit['bestFlux']:.3e})"
+    elif not fit["edge"]:
+        summary = f"Best poyntingFlux fit has no minimum between the simulated fluxes (best simulated: {fit['bestFlux']:.3e})"
+    else:
+        summary = f"Best poyntingFlux not bracketed by the sweep (best simulated: {fit['bestFlux']:.3e})"
+
+    if len(fit["suggestions"]) > 0:
+        summary += ", next to simulate: " + ", ".join(f"{flux:.3g}" for flux in fit["suggestions"])
+
+    return summary
+
+def writeFluxFit(rotation, fit):
+    """
+    REQUIRES:
+    - rotation: rotation name, used as the output file name
+    - fit: result of fitOptimalFlux
+
+    EFFECTS: writes the fit to outputDataFolder/[rotation]_flux_fit.json, with non-finite values (ex. the
+    uncertainty of an unbracketed fit) written as null
+    """
+    path = os.path.join(configs["outputDataFolder"], f"{rotation}_flux_fit.json")
+    atomicWrite(path, lambda file: json.dump(finiteOrNone(fit), file, indent = 4, allow_nan = False), "w")
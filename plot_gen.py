@@ -1,25 +1,142 @@
 from config_local import *
-import matplotlib.pyplot as plt
+import matplotlib
+import matplotlib.colors
+import matplotlib.dates as mdates
 from matplotlib.ticker import MaxNLocator
+from matplotlib.collections import LineCollection
 import numpy as np
 import os
 from scrape_data import scrapeData
-from datetime import datetime, timedelta
 from data_utils import *
+from score_gen import *
 from plot_gen_poyntingflux import *
+from figure_template import *
+from profiling import stage, profiledRun
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-def plotResults(plotRotation, rotationData, openPlotWindow = False):
+class RotationFigure(FigureTemplate):
+    """
+    Sim results vs scraped observations of one rotation, one subplot per var in dataToPlot
+    (see plot_gen.plotResults)
+    """
+
+    @staticmethod
+    def signature():
+        return (tuple(configs["plotDimensions"]), tuple(configs["dataToPlot"]), tuple(configs["yLabels"]),
+                tuple(configs["isLogGraph"]), configs["plotSimDateBins"])
+
+    def setup(self):
+        dataToPlot = configs["dataToPlot"]
+        self.axes = []
+        self.simLines = [] # LineCollection of every run that isn't a best fit
+        self.dataLines = [] # scraped observations
+        self.bestPlotLines = [] # line of best fit of each plot only
+        self.bestOverallLines = [] # line of best fit overall
+
+        for i in range(len(dataToPlot)):
+            #subplot config, done once per template
+            ax = self.figure.add_subplot(len(dataToPlot), 1, i + 1)
+            ax.xaxis_date()
+            ax.grid(axis = "x", linestyle = "--")
+            ax.set_ylabel(configs['yLabels'][i])
+            ax.xaxis.set_major_locator(MaxNLocator(nbins = configs['plotSimDateBins'])) # sets number of bins
+            ax.margins(0) # removes left and right margins on graph
+
+            # if it's not the last plot...
+            if i + 1 != len(dataToPlot):
+                ax.set_xticklabels([]) #clears x axis tick labels
+
+            # use log scaling when applicable
+            if configs['isLogGraph'][i] == True:
+                ax.set_yscale("log")
+
+            # artists are added in drawing order: sims, then the scraped data, then the best fit lines in front
+            simLines = LineCollection([], linewidths = float(configs['plotSimLineWidth']))
+            ax.add_collection(simLines, autolim = False)
+
+            self.axes.append(ax)
+            self.simLines.append(simLines)
+            self.dataLines.append(ax.plot([], [], c = configs["plotDataLineColor"], linewidth = configs["plotDataLineWidth"])[0])
+            self.bestPlotLines.append(ax.plot([], [], c = configs["bestPlotFitLineColor"], linewidth = configs["bestPlotFitLineWidth"])[0])
+            self.bestOverallLines.append(ax.plot([], [], c = configs["bestOverallFitLineColor"], linewidth = configs["bestOverallFitLineWidth"])[0])
+
+    def update(self, runResults, scores, scrapedData, showProgress = None):
+        """
+        REQUIRES:
+        - runResults: runs of the rotation (rotationData[rotation])
+        - scores: result of score_gen.scoreRotation for the rotation
+        - scrapedData: observations of the last run's scraping timeframe (see scrape_data.scrapeData)
+        - showProgress (default = None): progress bar updated once per subplot
+
+        EFFECTS: replaces the plotted runs and observations with the given rotation's
+        """
+        runs = list(runResults)
+        indexOfBestLine = scores["bestIndex"]
+
+        # all runs are scored against the observations of the same rotation, the last run's
+        # timeframe is used for the x axis bounds and start time label
+        lastRun = runResults[runs[-1]]
+        startTime = scores["scrapeWindows"][-1][0]
+
+        # sim line x values are shared by all subplots, so they are converted to matplotlib dates once
+        simDates = [mdates.date2num(runResults[run]["timestamp"]) for run in runs]
+
+        for i, data in enumerate(configs["dataToPlot"]):
+            ax = self.axes[i]
+            ax.set_xlim(lastRun['timestamp'].min(), lastRun['timestamp'].max()) # bounds x axis to start and end times to avoid overflow
+
+            if i + 1 == len(self.axes):
+                # is the last plot, add start time label
+                ax.set_xlabel(f"Start time: {startTime}")
+
+            # opacity of each run's line, the best fitting run of this plot has an opacity of 1
+            opacityValues = scores["plotOpacities"][:, i]
+            bestPlotIndices = [j for j, opacity in enumerate(opacityValues) if opacity == 1 and j != indexOfBestLine]
+
+            # all other runs are drawn as a single collection with a color (and opacity) per line
+            otherIndices = [j for j in range(len(runs)) if j != indexOfBestLine and j not in bestPlotIndices]
+            colors = matplotlib.colors.to_rgba_array([configs['plotSimLineColor']] * len(otherIndices))
+            colors[:, 3] = [opacityValues[j] for j in otherIndices]
+
+            self.simLines[i].set_segments([np.column_stack((simDates[j], runResults[runs[j]][data])) for j in otherIndices])
+            self.simLines[i].set_color(colors)
+
+            # scraped data is drawn on top of all sim lines
+            dataVar = configs["varsToScrape"][i]
+            self.dataLines[i].set_data(mdates.date2num(scrapedData[dataVar]["timestamps"]), scrapedData[dataVar]["data"])
+
+            # lines of best fit, in front of everything else
+            self.bestPlotLines[i].set_data(*joinLines([simDates[j] for j in bestPlotIndices], [runResults[runs[j]][data] for j in bestPlotIndices]))
+            self.bestPlotLines[i].set_zorder(len(runs) + 1)
+            self.bestOverallLines[i].set_data(simDates[indexOfBestLine], runResults[runs[indexOfBestLine]][data])
+            self.bestOverallLines[i].set_zorder(len(runs) + 2)
+
+            autoscaleY(ax, [self.simLines[i]])
+
+            # sets maximum y-axis data cutoff
+            originalYLim = ax.get_ylim()
+            maxYAxis = configs["paramMaxValues"][i]
+            if maxYAxis != None:
+                if originalYLim[1] > maxYAxis:
+                    ax.set_ylim(originalYLim[0], maxYAxis)
+
+            if showProgress is not None:
+                showProgress.update(1)
+
+def plotResults(plotRotation, rotationData, openPlotWindow = False, showProgress = True):
     """
     REQUIRES:
     - plotRotation: string with the rotation name to plot (ex. 20140902)
     - rotationData: dict containing data for ALL rotations, format specified in main file
     - openPlotwindow (default = false): whether or not to open plot in a new window
+    - showProgress (default = true): whether or not to show the rotation's progress bar
 
     EFFECTS: plots variables in rotationData (specified in config_local),
     saves plots to plotSaveFolder (also specified in config_local)
 
-    Plots one rotation at a time.
+    Plots one rotation at a time. Difference values and the best run are calculated by
+    score_gen.scoreRotation, which also writes the rotation's data file.
 
     NOTE: Plot params and appearance can be configured in config_local
     """
@@ -27,10 +144,6 @@ def plotResults(plotRotation, rotationData, openPlotWindow = False):
     runResults = rotationData[plotRotation]
     dataToPlot = configs["dataToPlot"]
     
-    dataFile = datafile(plotRotation)
-    dataFile.add("Poynting_flux\tDist_U\tDist_N\tDist_T\tDist_B\tave_un")
-    dataFile.newLine()
-    
     print("\n")
     print(f"[Rotation = {plotRotation}] Plotting {len(dataToPlot)} quantities from {len(runResults)} simulation results ...")
 
@@ -39,199 +152,78 @@ def plotResults(plotRotation, rotationData, openPlotWindow = False):
         os.makedirs(plotSaveDirectory)
         print(f"Created output folder at {plotSaveDirectory}")
 
-    # loops through every sim result, then plots specified values into each subplot before moving to the next
-    # plt.figure resets the plot so each function call works on a clean slate
-    plt.figure(figsize = configs['plotDimensions'])
-
-    # the indices for each array are the same for each plot
-    # ie. simLines[1] has the run name at simRunNames[1]
-    simLines = [[] for i in range(len(dataToPlot))] # contains data for each line in the plot
-    diffValues = [[] for i in range(len(dataToPlot))]
-    simRunNames = []
-    poyntingFluxes = []
-
-    #TODO: replace above arrays with structured dict
-    # plotData Structure:
-    # Var1
-    # |-- simLines
-    # |-- diffValues
-    # |-- simRunNames
-    # |-- poyntingFluxes
-    # Var2
-    # |-- simLines ...
-    #
-    # All subkeys are arrays with indices that correspond to each other
-    plotData = dict()
-    
-    # sets up progress bar
-    total = 100
-    pbar = tqdm(total=total)
-    pbarIncrement = np.floor(((1 / (len(runResults) * len(dataToPlot))) * 100) * 10**8) / 10**8
-    
-    # loop through all sim runs in the rotation
-    for runIter, run in enumerate(runResults):
-        # sets start and end times for data scraping
-        startTime = min(runResults[run]['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
-        endTime = max(runResults[run]['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
-
-        simRunNames.append(run)
-        poyntingFluxes.append(float(runResults[run]["poyntingFlux"]))
-
-        # shifts the scraping timeframe back by 4.5 hours to account for delay in start/end of data collection vs sim timeframe
-        startTimeDT = datetime.strptime(startTime, '%Y-%m-%d %H:%M:%S') - timedelta(hours = 4.5)
-        alteredStartTime = startTimeDT.strftime('%Y-%m-%d %H:%M:%S')
-        endTimeDT = datetime.strptime(endTime, '%Y-%m-%d %H:%M:%S') - timedelta(hours = 4.5)
-        alteredEndTime = endTimeDT.strftime('%Y-%m-%d %H:%M:%S')
-
-        # NOTE: This will run for EVERY iteration, thus making identical requests
-        # HOWEVER, scrapeData will cache requests so repeat requests are returned immediately w/o scraping
-        scrapedData = scrapeData(configs["varsToScrape"], alteredStartTime, alteredEndTime)
-
-        #in each sim run, loop through each data value specified in config_local
-        for i, data in enumerate(dataToPlot):
-            #subplot config
-            plt.subplot(len(dataToPlot), 1, i + 1)
-            plt.grid(axis = "x", linestyle = "--")
-            plt.ylabel(configs['yLabels'][i])
-            plt.gca().xaxis.set_major_locator(MaxNLocator(nbins = configs['plotSimDateBins'])) # sets number of bins
-            plt.margins(0) # removes left and right margins on graph
-            plt.xlim(min(runResults[run]['timestamp']), max(runResults[run]['timestamp'])) # bounds x axis to start and end times to avoid overflow
+    # calculates difference values and the best run, writes the rotation's data file
+    scores = scoreRotation(plotRotation, rotationData)
 
-            # if it's not the last plot...
-            if i + 1 != len(dataToPlot):
-                plt.gca().set_xticklabels([]) #clears x axis tick labels
-            else:
-                # is the last plot, do not clear x axis tick labels and add start time label
-                plt.xlabel(f"Start time: {min(runResults[run]['timestamp']).strftime('%Y-%m-%d %H:%M:%S')}")
+    # the figure's subplots are set up once per process and refilled for every rotation
+    figure = reusableFigure(RotationFigure, openPlotWindow)
 
-            # use log scaling when applicable
-            if configs['isLogGraph'][i] == True:
-                plt.yscale("log")
+    # scrapeData returns the request made while scoring from its cache
+    startTime, alteredStartTime, alteredEndTime = scores["scrapeWindows"][-1]
+    scrapedData = scrapeData(configs["varsToScrape"], alteredStartTime, alteredEndTime)
 
-            # plot data in corresponding subplot. If data already exists, it'll add on to the graph
-            # and create a plot with multiple lines
-            simTimestamps = runResults[run]["timestamp"]
-            simValues = runResults[run][data]
-            currentSimLine = plt.plot(np.array(simTimestamps), np.array(simValues), c = configs['plotSimLineColor'], linewidth = configs['plotSimLineWidth'])
-            simLines[i].append(currentSimLine)
+    # sets up progress bar, one step per subplot
+    pbar = tqdm(total = len(dataToPlot), disable = not showProgress)
+    with stage("render"):
+        figure.update(runResults, scores, scrapedData, pbar)
+    pbar.close()
 
-            #dataVar contains the current scraped variable being plotted
-            dataVar = configs["varsToScrape"][i]
+    print(f"Best simulation run: {scores['bestRunName']} (poyntingFlux = {scores['bestPoyntingFlux']})")
+    print(fluxFitSummary(scores["fluxFit"]))
+
+    # launches plot as new window if openPlotWindow is true
+    # value passed by -showplot flag via cmd
+    if openPlotWindow:
+        figure.show()
 
-            #overlays scraped data onto current subplot
-            dataTimestamps = scrapedData[dataVar]["timestamps"]
-            dataValues = scrapedData[dataVar]["data"]
-
-            #only plot the scraped data on the LAST iteration as further plotting will only overlap the previous plot
-            #last iteration is used as it'll stack the plot on top of all sim lines
-            if runIter == len(runResults) - 1:
-                plt.plot(np.array(dataTimestamps), np.array(dataValues), c = configs["plotDataLineColor"], linewidth = configs["plotDataLineWidth"])
-
-            #--DIFF CALCULATION--
-            #normalize timestamps into int format (for calculatinglline differences)
-            simTimestamps = [int(dt.timestamp()) for dt in simTimestamps]
-            dataTimestamps = dataTimestamps.astype(str)
-            dataTimestamps = [ts.split(".")[0] for ts in dataTimestamps] #removes unnecessary subsecond precision
-            dataTimestamps = [int(datetime.strptime(ts, '%Y-%m-%dT%H:%M:%S').timestamp()) for ts in dataTimestamps]
-            
-            #calculate difference with given method
-            lineDiffValue = difference_sim_obs(simTimestamps, simValues, dataTimestamps, dataValues, configs["diffCalcMethod"])
-            diffValues[i].append(lineDiffValue)
-
-            #save values to plotData dict
-            #TODO: reformat old code to accept the new data format and delete legacy arrays
-            #NOTE: until then, this code has no purpose
-            if data not in plotData:
-                plotData[data] = {
-                    "simLines": [],
-                    "diffValues": [],
-                    "simRunNames": [],
-                    "poyntingFluxes": [],
-                }
-            
-            currentPlotData = plotData[data]
-            currentPlotData["simLines"].append(currentSimLine)
-            currentPlotData["diffValues"].append(lineDiffValue)
-            currentPlotData["simRunNames"].append(run)
-            currentPlotData["poyntingFluxes"].append(runResults[run]["poyntingFlux"])
-            
-            # update progress bar
-            pbar.update(pbarIncrement)
+    with stage("savefig"):
+        figure.save(f"{plotSaveDirectory}/{plotRotation}.png")
+    figure.close()
     
-    # calculates line opacities and line of best fit
-    for i, valueSet in enumerate(diffValues):
-        opacityValues = findPlotOpacities(valueSet)
+    # Plot poynting flux value vs difference in lines
+    poyntingFluxValues = [float(x) for x in scores["poyntingFluxes"]]
+    with stage("poyntingFluxPlot"):
+        plotPoyntingFluxGraph(scores["diffAverages"], scores["filteredDiffValues"], poyntingFluxValues, plotRotation, plotSaveDirectory, openPlotWindow, scores["fluxFit"])
 
-        # normalizes line difference values for the specific plot
-        diffValues[i] = normalizeData(valueSet)
+def initPlotWorker(workerConfigs):
+    """
+    REQUIRES:
+    - workerConfigs: configs of the parent process, including command line overrides
 
-        for j, line in enumerate(simLines[i]):
-            opacity = opacityValues[j]
+    EFFECTS: sets up a plotting worker process. Workers always render with the
+    non-interactive Agg backend so no pyplot window state is shared.
+    """
+    matplotlib.use("Agg")
+    configs.update(workerConfigs)
 
-            if(opacity == 1):
-                line[0].set_color(configs["bestPlotFitLineColor"])
-                line[0].set_linewidth(configs["bestPlotFitLineWidth"])
-                line[0].set_zorder(len(simLines[i]) + 1) # move best fit line to front
+def plotRotationWorker(plotRotation, runResults):
+    """
+    REQUIRES:
+    - plotRotation: string with the rotation name to plot
+    - runResults: the runs of that rotation only (rotationData[plotRotation])
 
-            line[0].set_alpha(opacityValues[j])
-            
-    # only keep important param difference value data in diffValues (other params will be ignore in calculation)
-    filteredDiffValues = filterDatasetByVarName(diffValues, configs["dataToPlot"], configs["importantParams"])[1]        
-    
-    # send data to text output file
-    for i, val in enumerate(diffValues[0]):
-        # consistent poynting flux values across all variables
-        dataFile.add(plotData[configs["dataToPlot"][0]]["poyntingFluxes"][i])
-        for valueSet in diffValues:
-            dataFile.add(round(valueSet[i], 4))
-        
-        filteredDiffAvg = 0
-        for valueSet in filteredDiffValues:
-            filteredDiffAvg += valueSet[i]
-            
-        dataFile.add(round(filteredDiffAvg / len(filteredDiffValues), 4))
-        dataFile.newLine()
-
-    # finds and plots overall best line
-    diffAverages = calculate2DArrayAverage(filteredDiffValues)
-    indexOfBestLine = indexOfMinValue(diffAverages)
-
-    # sets maximum y-axis data cutoff
-    axes = plt.gcf().get_axes()
-    for i, ax in enumerate(axes):
-        originalYLim = ax.get_ylim()
-        maxYAxis = configs["paramMaxValues"][i]
-        if maxYAxis != None:
-            if originalYLim[1] > maxYAxis:
-                ax.set_ylim(originalYLim[0], maxYAxis)
-    
-    for i in range(len(configs["dataToPlot"])):
-        bestOverallLine = simLines[i][indexOfBestLine][0]
+    EFFECTS: plots the rotation in a worker process, returns the number of runs plotted
+    """
+    with profiledRun(plotRotation):
+        plotResults(plotRotation, {plotRotation: runResults}, showProgress = False)
 
-        bestOverallLine.set_color(configs["bestOverallFitLineColor"])
-        bestOverallLine.set_linewidth(configs["bestOverallFitLineWidth"])
-        bestOverallLine.set_zorder(len(simLines[i]) + 2) # move best fit line to front
+    return len(runResults)
 
-        bestOverallLine.set_alpha(1)
-    
-    bestRunName = simRunNames[indexOfBestLine]
-    bestPoyntingFlux = runResults[bestRunName]["poyntingFlux"]
-    
-    pbar.update(100 - pbar.n)
-    pbar.close()
+def plotRotationsParallel(rotationData, workers):
+    """
+    REQUIRES:
+    - rotationData: dict containing data for ALL rotations, format specified in main file
+    - workers: number of worker processes
 
-    print(f"Best simulation run: {bestRunName} (poyntingFlux = {bestPoyntingFlux})")
+    EFFECTS: plots every rotation in rotationData on a process pool of the given size.
+    Each worker is sent only its rotation's runs, and progress (in runs plotted) is shown
+    in a single progress bar. Output files are the same as plotting each rotation with plotResults.
+    """
+    totalRuns = sum(len(runResults) for runResults in rotationData.values())
 
-    # launches plot as new window if openPlotWindow is true
-    # value passed by -showplot flag via cmd
-    if openPlotWindow:
-        plt.show()
+    with ProcessPoolExecutor(max_workers = workers, initializer = initPlotWorker, initargs = (dict(configs),)) as executor:
+        futures = [executor.submit(plotRotationWorker, rotation, rotationData[rotation]) for rotation in rotationData]
 
-    plt.savefig(f"{plotSaveDirectory}/{plotRotation}.png", dpi = 300)
-    plt.close()
-    
-    # Plot poynting flux value vs difference in lines
-    poyntingFluxValues = [float(x) for x in plotData[next(iter(plotData))]["poyntingFluxes"]]
-    plotPoyntingFluxGraph(diffAverages, filteredDiffValues, poyntingFluxValues, plotRotation, plotSaveDirectory, openPlotWindow)
-    
-    dataFile.close()
\ No newline at end of file
+        with tqdm(total = totalRuns, unit = "run") as pbar:
+            for future in as_completed(futures):
+                pbar.update(future.result())
@@ -1,7 +1,8 @@
 from config_local import *
-import matplotlib.pyplot as plt
 from matplotlib.ticker import MaxNLocator, FixedLocator
 from data_utils import *
+from ranking import bestScoreIndex
+from figure_template import *
 import os
 
 def sortDataPoints(x_values, y_values):
@@ -21,7 +22,93 @@ def scientificNotation(num):
     """
     return "{:.1e}".format(num)
 
-def plotPoyntingFluxGraph(avgDiffValues, allDiffData, poyntingFluxValues, rotation, saveFolder, showPlots = False):
+class PoyntingFluxFigure(FigureTemplate):
+    """
+    Difference values vs poynting flux of one rotation, one subplot per important param
+    plus the average (see plotPoyntingFluxGraph)
+    """
+
+    @staticmethod
+    def signature():
+        return (tuple(configs["plotDimensions"]), tuple(configs["importantParams"]), configs["diffValueBins"])
+
+    def setup(self):
+        plotCount = len(configs["importantParams"]) + 1
+        self.axes = []
+        self.lines = []
+        self.points = []
+        self.bestTexts = []
+
+        for i in range(plotCount):
+            ax = self.figure.add_subplot(plotCount, 1, i + 1)
+
+            self.axes.append(ax)
+            self.lines.append(ax.plot([], [], color = configs["diffPlotColor"])[0])
+            self.points.append(ax.scatter([], [], color = configs["diffPlotColor"], zorder = 10))
+            self.bestTexts.append(ax.text(0.5, 0.95, "", transform = ax.transAxes, fontsize = 10, ha = 'center', va = 'top'))
+
+            ax.grid(True, linestyle = "--", alpha = 0.5)
+            ax.xaxis.set_major_locator(MaxNLocator(integer = True))
+            ax.yaxis.set_major_locator(MaxNLocator(nbins = configs["diffValueBins"]))
+
+            if i + 1 < plotCount:
+                ax.set_ylabel(f"Diff Value ({configs['importantParams'][i]})")
+
+        self.title = self.axes[0].set_title("")
+
+        #interpolated optimum, on the average plot
+        ax = self.axes[-1]
+        ax.set_xlabel("Poynting Flux Values")
+        ax.set_ylabel("Avg. Diff Value")
+        self.fitLine = ax.plot([], [], color = configs["diffBestPointColor"], linestyle = "--", linewidth = 1)[0]
+        self.optimumLine = ax.axvline(0, color = configs["diffBestPointColor"], linestyle = ":", linewidth = 1)
+        self.optimumText = ax.text(0.5, 0.8, "", transform = ax.transAxes, fontsize = 10, ha = 'center', va = 'top')
+
+    def update(self, rotation, poyntingFluxValues, allDiffData, avgDiffValues, fluxFit = None):
+        """
+        REQUIRES:
+        - rotation: name of rotation
+        - poyntingFluxValues: sorted poynting flux values
+        - allDiffData, avgDiffValues: difference values of each important param and their average, sorted like poyntingFluxValues
+        - fluxFit (default = None): result of flux_fit.fitOptimalFlux
+
+        EFFECTS: replaces the plotted difference values with the given rotation's
+        """
+        self.title.set_text(f"Correlation between Poynting Flux and Simulation Accuracy For Rotation {rotation}")
+
+        for i, data in enumerate(list(allDiffData) + [avgDiffValues]):
+            ax = self.axes[i]
+            isAverage = i == len(allDiffData)
+
+            #sets best point to a different color, the averages are already oriented (see ranking.averageScores)
+            minIndex = bestScoreIndex(data, configs["diffCalcMethod"], oriented = isAverage)
+            plotColors = [configs["diffBestPointColor"] if j == minIndex else configs["diffPlotColor"] for j in range(len(avgDiffValues))]
+
+            self.lines[i].set_data(poyntingFluxValues, data)
+            self.points[i].set_offsets(np.column_stack((poyntingFluxValues, data)))
+            self.points[i].set_facecolor(plotColors)
+            self.points[i].set_edgecolor(plotColors)
+            self.bestTexts[i].set_text(f"Best: {scientificNotation(poyntingFluxValues[minIndex])} (Diff={round(data[minIndex], 6)})")
+
+            if isAverage:
+                #plots the interpolated optimum
+                hasFit = fluxFit is not None and len(fluxFit["curve"]) > 0
+                bracketed = hasFit and fluxFit["bracketed"]
+
+                self.fitLine.set_data(*(fluxFit["curve"] if hasFit else [[], []]))
+                self.optimumLine.set_visible(bracketed)
+                self.optimumLine.set_xdata([fluxFit["optimum"]] * 2 if bracketed else [0, 0])
+                self.optimumText.set_text(f"Interpolated: {scientificNotation(fluxFit['optimum'])} +/- {scientificNotation(fluxFit['uncertainty'])}" if bracketed else "")
+
+            # hidden artists don't count towards the axis limits
+            ax.relim(visible_only = True)
+            ax.set_autoscalex_on(True)
+            ax.set_autoscaley_on(True)
+            ax.autoscale_view()
+
+            if np.max(avgDiffValues) > 1.5: ax.set_ylim(0, 1.5 if isAverage else 2)
+
+def plotPoyntingFluxGraph(avgDiffValues, allDiffData, poyntingFluxValues, rotation, saveFolder, showPlots = False, fluxFit = None):
     """
     REQUIRES:
     - avgDiffValues, poyntingFluxValues: two arrays of equal length
@@ -31,6 +118,7 @@ def plotPoyntingFluxGraph(avgDiffValues, allDiffData, poyntingFluxValues, rotati
     - saveFolder: folder to save in, saves to configs["plotSaveFolder"]/analysis_results/[rotation]_result.png when
         called in plot_gen
     - showPlots (default = false): whether or not to open plot in a new window
+    - fluxFit (default = None): result of flux_fit.fitOptimalFlux, its fitted curve and optimum are drawn on the average plot
 
     EFFECTS: plots (avgDiffValues, poyntingFluxValues) on (x, y) for all items in arrays
 
@@ -47,57 +135,12 @@ def plotPoyntingFluxGraph(avgDiffValues, allDiffData, poyntingFluxValues, rotati
     for i, data in enumerate(allDiffData):
         poyntingFluxValues, allDiffData[i] = sortDataPoints(poyntingFluxValues, allDiffData[i])
         
-    plt.figure(figsize = configs["plotDimensions"])
-    
-    #plots each individual variable's data points
-    for i, data in enumerate(allDiffData):
-        ax = plt.subplot(len(allDiffData) + 1, 1, i + 1)
-        ax.plot(poyntingFluxValues, data, color = configs["diffPlotColor"])
-        
-        #plots title on first graph
-        if i == 0:
-            plt.title(f"Correlation between Poynting Flux and Simulation Accuracy For Rotation {rotation}")
-        
-        minIndex = indexOfMinValue(data)
-        
-        plt.text(0.5, 0.95, f"Best: {scientificNotation(poyntingFluxValues[minIndex])} (Diff={round(np.min(data), 6)})", transform=plt.gca().transAxes, fontsize=10, ha='center', va='top')
-        
-        plotColors = [configs["diffBestPointColor"] if i == minIndex else configs["diffPlotColor"] for i in range(len(avgDiffValues))]
-        scatterPlot = ax.scatter(poyntingFluxValues, data, color = plotColors)
-        scatterPlot.set_zorder(10)
-        
-        plt.grid(True, linestyle = "--", alpha = 0.5)
-        ax.set_ylabel(f"Diff Value ({configs['importantParams'][i]})")
-        
-        if np.max(avgDiffValues) > 1.5: ax.set_ylim(0, 2)
+    # the figure's subplots are set up once per process and refilled for every rotation
+    figure = reusableFigure(PoyntingFluxFigure, showPlots)
+    figure.update(rotation, poyntingFluxValues, allDiffData, avgDiffValues, fluxFit)
 
-        plt.gca().xaxis.set_major_locator(MaxNLocator(integer=True))
-        plt.gca().yaxis.set_major_locator(MaxNLocator(nbins=configs["diffValueBins"]))
-    
-    #plots overall average diff values in last subplot
-    ax = plt.subplot(len(allDiffData) + 1, 1, len(allDiffData) + 1)
-    
-    #sets min point to a different color
-    minIndex = indexOfMinValue(avgDiffValues)
-    plotColors = [configs["diffBestPointColor"] if i == minIndex else configs["diffPlotColor"] for i in range(len(avgDiffValues))]
-
-    plt.plot(poyntingFluxValues, avgDiffValues, color = configs["diffPlotColor"])
-    scatterPlot = plt.scatter(poyntingFluxValues, avgDiffValues, color = plotColors)
-    scatterPlot.set_zorder(10)
-    
-    plt.text(0.5, 0.95, f"Best: {scientificNotation(poyntingFluxValues[minIndex])} (Diff={round(np.min(avgDiffValues), 6)})", transform=plt.gca().transAxes, fontsize=10, ha='center', va='top')
-
-    plt.xlabel("Poynting Flux Values")
-    plt.ylabel("Avg. Diff Value")
-
-    plt.grid(True, linestyle = "--", alpha = 0.5)
-    if np.max(avgDiffValues) > 1.5: ax.set_ylim(0, 1.5)
-
-    plt.gca().xaxis.set_major_locator(MaxNLocator(integer=True))
-    plt.gca().yaxis.set_major_locator(MaxNLocator(nbins=configs["diffValueBins"]))
-    
     if showPlots:
-        plt.show()
+        figure.show()
         
-    plt.savefig(f"{saveFolder}/{rotation}_result.png", dpi = 300)
-    plt.close()
\ No newline at end of file
+    figure.save(f"{saveFolder}/{rotation}_result.png")
+    figure.close()
@@ -1,21 +1,34 @@
 from config_local import *
 import os
+import sys
 import numpy as np
 import math
 import argparse
-from plot_gen import *
 from data_utils import *
 from data_parser import *
+from data_cache import *
+from data_index import *
+from campaign_store import *
+from score_gen import *
+from score_validation import *
+from sim_watcher import SimWatcher
+from scrape_data import clearCachedData
+from profiling import stage, profiledRun, timings, writeProfile, profileFolder
 
-simDirectory = configs["simDirectory"]
-#NOTE: configs["plotSaveFolder"] must be accessed directly in this file so it can be overriden by cmd arguments
-#This value is then used in different modules
+def main(argv = None):
+    """
+    REQUIRES:
+    - argv (default = sys.argv[1:]): command line arguments
 
-print(f"Indexing data from {simDirectory} ...")
+    EFFECTS: indexes the simulation directory and plots the requested rotation(s)
 
-#parses user command line input with flags
-plotRotation = ""
-if __name__ == "__main__":
+    NOTE: kept behind main() so worker processes (-j) can import this module without side effects
+    """
+    simDirectory = configs["simDirectory"]
+    #NOTE: configs["plotSaveFolder"] must be accessed directly in this file so it can be overriden by cmd arguments
+    #This value is then used in different modules
+
+    #parses user command line input with flags
     #add arguments to parse
     parser = argparse.ArgumentParser(description = "Plot simulation results given a rotation date.")
     parser.add_argument("-t", help = "Rotation date (ex. 20120516).")
@@ -23,11 +36,26 @@ if __name__ == "__main__":
     parser.add_argument("-o", help = "Folder to output plots, default is " + configs["plotSaveFolder"])
     parser.add_argument("-showplot", action = "store_true", help = "Opens graph as new window when the script finishes")
     parser.add_argument("-m", help = "Method to calc between actual and sim data [mae, scc, curve_distance, mse]. Default: " + configs["diffCalcMethod"])
+    parser.add_argument("-j", type = int, default = 1, help = "Number of worker processes used to plot rotations when no rotation is specified. Default: 1")
+    parser.add_argument("--index-workers", type = int, default = 1, help = "Number of workers used to read and parse simulation runs. Default: 1")
+    parser.add_argument("--score-only", action = "store_true", help = "Only calculate difference tables and best runs, without rendering plots")
+    parser.add_argument("--offline", action = "store_true", help = "Only use cached observation data, never connect to CDAWeb")
+    parser.add_argument("--seed-omni", action = "store_true", help = "Download the observation data of the requested rotation(s) into the cache and exit")
+    parser.add_argument("--no-cache", action = "store_true", help = "Parse all sim files without reading or writing the parsed data cache")
+    parser.add_argument("--rebuild-cache", action = "store_true", help = "Reparse all sim files and overwrite the parsed data cache")
+    parser.add_argument("--build-store", action = "store_true", help = "Pack all runs into the memory-mapped campaign store and exit")
+    parser.add_argument("--watch", action = "store_true", help = "Keep running and rescore/replot the rotation(s) whose runs are added or changed in the sim directory (with --score-only, only rescore)")
+    parser.add_argument("--validate", nargs = "?", const = configs["validationFolder"], metavar = "FOLDER", help = "Compare the difference tables of the rotations with a reference table against it (default folder: " + configs["validationFolder"] + "), offline with its recorded observations. Combine with --seed-omni to record them")
+    parser.add_argument("--profile", action = "store_true", help = "Write a stage timing report per rotation to " + profileFolder())
+    parser.add_argument("--profile-stats", action = "store_true", help = "With --profile, also dump cProfile stats per rotation")
 
     #parse resulting args
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     plotRotation = args.t
     openPlotWindow = args.showplot
+    #validation always reparses and rescores the runs, so it checks the current parser and scoring
+    useCache = not args.no_cache and args.validate is None
+    rebuildCache = args.rebuild_cache
 
     #overrides default config value if sim directory is specified via cmd
     if args.sp is not None:
@@ -36,81 +64,299 @@ if __name__ == "__main__":
     #overrides default config value if output folder location is specified via cmd
     if args.o is not None:
         configs["plotSaveFolder"] = args.o
-        
+
     #overrides default config value if data difference calc method is specified via cmd
     if args.m is not None:
         configs["diffCalcMethod"] = args.m
 
-#validates user configs and input
-if not os.path.isdir(simDirectory):
-    raise FileNotFoundError(f"Directory \"{simDirectory}\" wasn't found.")
-
-# sets up data output folder
-outputDataFolder = configs["outputDataFolder"]
-if not os.path.exists(outputDataFolder):
-    os.makedirs(outputDataFolder)
-    print(f"Created data output folder at {outputDataFolder}")
-
-#simFolders is a list of all runs' folders
-simFolders = [name for name in os.listdir(simDirectory) if os.path.isdir(os.path.join(simDirectory, name))]
-
-# rotationData Structure:
-# 20110201
-# |-- run001_AWSoM 
-#     |-- it
-#     |-- timestamp
-#     |-- earthCoords, etc.
-# |-- run002_AwSom ...
-#
-# Example: rotationData["20110201"]["run001_AWSoM"]["timestamp"] will return a list of values
-rotationData = dict()
-
-#loop through and index all simulation folder contents
-for run in simFolders:
-    with open(f"./{simDirectory}/{run}/{configs['simParamLocation']}", "r") as file:
-        fileContents = file.readlines()
-
-        #param structure: model, map, PoyntingFluxPerBSi, realizations
-        params = {}
-        for line in fileContents:
-            key, value = line.strip().split("=")
-            params[key.strip()] = value.strip()
-
-        #gets rotation name from params list
-        rotation = params["map"].split("/")[1].split("_")[1]
-
-        simResults = parseSimRunResults(f"./{simDirectory}/{run}/{configs['simResultsLocation']}")
-
-        #add poynting flux as additional param to simResults
-        simResults["poyntingFlux"] = params["PoyntingFluxPerBSi"]
-
-        #add folder and results to its corresponding rotation name key in rotationData
-        if rotation in rotationData:
-            #if the rotation already exists, do not create another rotation dict key
-            #instead, add the run name to the existing key
-            rotationData[rotation][run] = simResults
+    #writes timing reports (and cProfile stats) if profiling is specified via cmd
+    if args.profile:
+        configs["profile"] = True
+        configs["profileStats"] = args.profile_stats
+
+    #only use observations from the on-disk cache if offline mode is specified via cmd
+    if args.offline:
+        configs["omniOffline"] = True
+
+    #validation reads (or with --seed-omni, records) observations from the fixture in its reference folder
+    if args.validate is not None:
+        configs["validationFolder"] = args.validate
+        configs["omniCacheFolder"] = os.path.abspath(validationFixtureFolder())
+        configs["omniCacheTTLDays"] = None
+        configs["omniCacheMaxMB"] = None
+        configs["omniOffline"] = not args.seed_omni
+
+    if args.j < 1:
+        parser.error("-j must be at least 1")
+
+    if args.index_workers < 1:
+        parser.error("--index-workers must be at least 1")
+
+    print(f"Indexing data from {simDirectory} ...")
+
+    #validates user configs and input
+    if not os.path.isdir(simDirectory):
+        raise FileNotFoundError(f"Directory \"{simDirectory}\" wasn't found.")
+
+    # sets up data output folder
+    outputDataFolder = configs["outputDataFolder"]
+    if not os.path.exists(outputDataFolder):
+        os.makedirs(outputDataFolder)
+        print(f"Created data output folder at {outputDataFolder}")
+
+    # rotationData Structure:
+    # 20110201 (RotationRuns, see data_index)
+    # |-- run001_AWSoM (RunResult, see data_parser)
+    #     |-- it
+    #     |-- timestamp
+    #     |-- earthCoords, etc.
+    # |-- run002_AwSom ...
+    #
+    # Example: rotationData["20110201"]["run001_AWSoM"]["timestamp"] will return an array of values
+    #
+    # Only key_params.txt files are read while indexing, each run's results are loaded
+    # (from the parsed data cache or its .sat file) the first time the run is accessed
+    timings.reset()
+    with stage("index"):
+        rotationData = buildRotationIndex(simDirectory, useCache, rebuildCache, args.index_workers)
+
+    print(f"Indexed {len(rotationData)} rotations:")
+    print(list(rotationData.keys()))
+
+    #unchanged runs are read from the campaign store (built with --build-store) when it exists
+    if useCache and not args.build_store:
+        storedRuns = attachCampaignStore(rotationData)
+        if storedRuns > 0:
+            print(f"Mapped {storedRuns} runs from the campaign store")
+
+    if configs["profile"]:
+        writeProfile("index", dict(name = "index", **timings.report()))
+
+    #loads runs' results on a process pool when --index-workers is given
+    indexPool = createIndexPool(args.index_workers)
+    try:
+        if args.build_store:
+            storeOnly(rotationData, indexPool)
+        elif args.validate is not None:
+            if args.seed_omni:
+                seedOnly(rotationData, plotRotation, indexPool, referenceRotations())
+            else:
+                return validateOnly(rotationData, plotRotation, indexPool)
+        elif args.seed_omni:
+            seedOnly(rotationData, plotRotation, indexPool)
+        elif args.watch:
+            watchRotations(rotationData, plotRotation, simDirectory, args.score_only, indexPool, useCache, rebuildCache)
+        elif args.score_only:
+            scoreOnly(rotationData, plotRotation, indexPool)
         else:
-            #otherwise, create a new rotation key and make simResults the first value
-            rotationData[rotation] = {run: simResults}
-        
-print(f"Indexed {len(rotationData)} rotations:")
-print(list(rotationData.keys()))
-
-#plot all rotations and terminate program if no rotation specified
-if plotRotation is None:
-    print(f"\nNo rotation specified, plotting all {len(rotationData)}")
-
-    #loop through each rotation stored in rotationData and plot it
-    #the attributes to plot are specified in config_local
-    for rotationName in rotationData.keys():
-        plotResults(rotationName, rotationData)
-
-    raise SystemExit
-
-#check if rotation exists
-if plotRotation in rotationData:
-    #if it does, plot the data for it
-    print(f"\nCreating plot for rotation {plotRotation}...")
-    plotResults(plotRotation, rotationData, openPlotWindow)
-else:
-    print(f"\nError: no sim data for rotation {plotRotation} found. Typo?")
\ No newline at end of file
+            plotRotations(rotationData, plotRotation, openPlotWindow, args.j, indexPool)
+    finally:
+        if indexPool is not None:
+            indexPool.shutdown()
+
+def plotRotations(rotationData, plotRotation, openPlotWindow, workers, indexPool):
+    """
+    REQUIRES:
+    - rotationData: dict of rotation name -> RotationRuns
+    - plotRotation: rotation to plot, or None to plot all rotations
+    - openPlotWindow: whether or not to open the plot in a new window
+    - workers: number of worker processes to plot rotations with
+    - indexPool: process pool to load runs with, or None (see data_index.createIndexPool)
+
+    EFFECTS: plots the requested rotation(s)
+    """
+    #matplotlib is only imported when plots are rendered
+    from plot_gen import plotResults, plotRotationsParallel
+
+    #plot all rotations and terminate program if no rotation specified
+    if plotRotation is None:
+        print(f"\nNo rotation specified, plotting all {len(rotationData)}")
+
+        #plots rotations on a process pool, each worker only receives its rotation's runs
+        if workers > 1:
+            plotRotationsParallel(rotationData, workers)
+            return
+
+        #loop through each rotation stored in rotationData and plot it
+        #the attributes to plot are specified in config_local
+        for rotationName in rotationData.keys():
+            with profiledRun(rotationName):
+                rotationData[rotationName].preload(indexPool)
+                plotResults(rotationName, rotationData)
+
+            #frees the rotation's run results once it has been plotted
+            rotationData[rotationName].unload()
+
+        return
+
+    #check if rotation exists
+    if plotRotation in rotationData:
+        #if it does, plot the data for it
+        print(f"\nCreating plot for rotation {plotRotation}...")
+        with profiledRun(plotRotation):
+            rotationData[plotRotation].preload(indexPool)
+            plotResults(plotRotation, rotationData, openPlotWindow)
+    else:
+        print(f"\nError: no sim data for rotation {plotRotation} found. Typo?")
+
+def storeOnly(rotationData, indexPool):
+    """
+    REQUIRES:
+    - rotationData: dict of rotation name -> RotationRuns
+    - indexPool: process pool to load runs with, or None (see data_index.createIndexPool)
+
+    EFFECTS: packs every run of the campaign into the campaign store (see campaign_store)
+    """
+    storedRuns = buildCampaignStore(rotationData, indexPool)
+    dataPath = campaignStorePaths()[0]
+
+    print(f"Stored {storedRuns} runs ({os.path.getsize(dataPath) / 1e6:.1f} MB) in {dataPath}")
+
+def seedOnly(rotationData, plotRotation, indexPool, onlyRotations = None):
+    """
+    REQUIRES:
+    - rotationData: dict of rotation name -> RotationRuns
+    - plotRotation: rotation to seed, or None to seed all rotations
+    - indexPool: process pool to load runs with, or None (see data_index.createIndexPool)
+    - onlyRotations (default = all): names of the rotations that may be seeded
+
+    EFFECTS: downloads the observation data of the requested rotation(s) into the on-disk cache
+    """
+    if plotRotation is not None and plotRotation not in rotationData:
+        print(f"\nError: no sim data for rotation {plotRotation} found. Typo?")
+        return
+
+    #collects the timeframes of the whole campaign first so they are fetched with as few requests as possible
+    timeframes = set()
+    rotations = list(rotationData.keys()) if plotRotation is None else [plotRotation]
+    if onlyRotations is not None:
+        rotations = [rotationName for rotationName in rotations if rotationName in onlyRotations]
+
+    for rotationName in rotations:
+        rotationData[rotationName].preload(indexPool)
+        timeframes |= observationTimeframes(rotationData[rotationName])
+        rotationData[rotationName].unload()
+
+    seedObservationCache(timeframes)
+
+def scoreOnly(rotationData, plotRotation, indexPool):
+    """
+    REQUIRES:
+    - rotationData: dict of rotation name -> RotationRuns
+    - plotRotation: rotation to score, or None to score all rotations
+    - indexPool: process pool to load runs with, or None (see data_index.createIndexPool)
+
+    EFFECTS: writes the difference table and prints the best run of the requested rotation(s)
+    without importing matplotlib or rendering any plots
+    """
+    if plotRotation is None:
+        rotations = list(rotationData.keys())
+        print(f"\nNo rotation specified, scoring all {len(rotationData)}")
+    elif plotRotation in rotationData:
+        rotations = [plotRotation]
+    else:
+        print(f"\nError: no sim data for rotation {plotRotation} found. Typo?")
+        return
+
+    for rotationName in rotations:
+        with profiledRun(rotationName):
+            #only runs without up to date stored scores need their results loaded
+            rotationData[rotationName].preload(indexPool, runsToScore(rotationName, rotationData))
+            scoreRotations(rotationData, [rotationName])
+
+        #frees the rotation's run results once it has been scored
+        rotationData[rotationName].unload()
+
+def watchRotations(rotationData, plotRotation, simDirectory, scoreOnly, indexPool, useCache, rebuildCache):
+    """
+    REQUIRES:
+    - rotationData: dict of rotation name -> RotationRuns of simDirectory
+    - plotRotation: rotation to watch, or None to watch all rotations (including new ones)
+    - simDirectory: folder containing run###_AWSoM folders
+    - scoreOnly: whether to only rescore rotations, without rendering plots
+    - indexPool: process pool to load runs with, or None (see data_index.createIndexPool)
+    - useCache, rebuildCache: how runs are loaded (see data_cache.loadSimRun)
+
+    EFFECTS: brings the outputs of the watched rotation(s) up to date, then updates a rotation every
+    time its runs change (see sim_watcher.SimWatcher) until interrupted. Loaded runs and figure templates
+    stay in memory between updates, and the score store (see score_cache) only scores new or changed runs.
+    Observations are freed after every update, so a long watch doesn't accumulate every scraped timeframe,
+    and are read back from the on-disk cache when needed.
+    """
+    if scoreOnly:
+        #only runs without up to date stored scores need their results loaded
+        runsToLoad = lambda rotationName, rotationData: runsToScore(rotationName, rotationData)
+        updateOutputs = lambda rotationName, rotationData: scoreRotations(rotationData, [rotationName])
+    else:
+        #matplotlib is only imported when plots are rendered
+        from plot_gen import plotResults
+        runsToLoad = lambda rotationName, rotationData: None
+        updateOutputs = lambda rotationName, rotationData: plotResults(rotationName, rotationData)
+
+    def updateRotation(rotationName, rotationData):
+        try:
+            with profiledRun(rotationName):
+                rotationData[rotationName].preload(indexPool, runsToLoad(rotationName, rotationData))
+                updateOutputs(rotationName, rotationData)
+        finally:
+            clearCachedData()
+
+    rotations = None if plotRotation is None else [plotRotation]
+    if plotRotation is not None and plotRotation not in rotationData:
+        print(f"\nNo sim data for rotation {plotRotation} yet, waiting for its runs")
+
+    initialRotations = [rotationName for rotationName in rotationData if rotations is None or rotationName in rotations]
+    SimWatcher(simDirectory, rotationData, updateRotation, rotations, useCache, rebuildCache).watch(initialRotations)
+
+def validateOnly(rotationData, plotRotation, indexPool):
+    """
+    REQUIRES:
+    - rotationData: dict of rotation name -> RotationRuns
+    - plotRotation: rotation to validate, or None to validate all rotations with a reference table
+    - indexPool: process pool to load runs with, or None (see data_index.createIndexPool)
+
+    EFFECTS: compares the difference table of each requested rotation with its reference table
+    (see score_validation) and prints the result. Returns 0 if all rotations passed, otherwise 1.
+    """
+    references = referenceRotations()
+    rotations = references if plotRotation is None else [plotRotation]
+
+    for rotationName in rotations:
+        if rotationName not in references:
+            print(f"\nError: no reference table for rotation {rotationName} in {configs['validationFolder']}")
+            return 1
+
+    #reference tables are only useful with the runs they were made from
+    missingRotations = [rotationName for rotationName in rotations if rotationName not in rotationData]
+    if len(missingRotations) > 0:
+        print(f"\nSkipping reference tables without sim data: {missingRotations}")
+
+    rotations = [rotationName for rotationName in rotations if rotationName in rotationData]
+    if len(rotations) == 0:
+        print("\nError: no rotation to validate")
+        return 1
+
+    failed = []
+    for rotationName in rotations:
+        print(f"\n[Rotation = {rotationName}] Validating {len(rotationData[rotationName])} simulation results ...")
+
+        with profiledRun(rotationName):
+            rotationData[rotationName].preload(indexPool)
+            try:
+                report = validateRotation(rotationName, rotationData)
+            except ConnectionError as error:
+                report = None
+                print(f"  {error} (record the observations with --validate --seed-omni)")
+
+        rotationData[rotationName].unload()
+
+        if report is not None:
+            print(validationSummary(report))
+        if report is None or not report["passed"]:
+            failed.append(rotationName)
+
+    print(f"\nValidated {len(rotations)} rotation(s), {len(rotations) - len(failed)} passed" + (f", failed: {failed}" if len(failed) > 0 else ""))
+    return 1 if len(failed) > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import cProfile
+import functools
+from contextlib import contextmanager
+from config_local import *
+
+# NOTE: this module is imported by data_utils, so it must not import any other module of the program
+
+class StageTimer:
+    """
+    Wall time and number of calls of each named pipeline stage, plus named counters.
+    Stage times are inclusive, ie. a stage running inside another one counts towards both.
+    """
+
+    def __init__(self):
+        self.stages = dict() # stage name -> [seconds, calls]
+        self.counters = dict() # counter name -> count
+
+    @contextmanager
+    def stage(self, name):
+        """
+        REQUIRES:
+        - name: stage name (ex. "fetch")
+
+        EFFECTS: adds the wall time of the with block to the stage
+        """
+        startTime = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(name, [0.0, 0])
+            stage[0] += time.perf_counter() - startTime
+            stage[1] += 1
+
+    def count(self, name, amount = 1):
+        """
+        EFFECTS: adds amount to the named counter
+        """
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        """
+        EFFECTS: clears all stages and counters
+        """
+        self.stages.clear()
+        self.counters.clear()
+
+    def report(self):
+        """
+        EFFECTS: returns the stages and counters as a json serializable dict
+        """
+        return {
+            "stages": {name: {"seconds": round(seconds, 6), "calls": calls} for name, (seconds, calls) in self.stages.items()},
+            "counters": dict(self.counters)
+        }
+
+# timings of the current process, stages are recorded by every module through stage()/count()
+timings = StageTimer()
+
+def stage(name):
+    """
+    EFFECTS: times the with block as the named stage of timings, see StageTimer.stage
+    """
+    return timings.stage(name)
+
+def count(name, amount = 1):
+    """
+    EFFECTS: adds amount to the named counter of timings
+    """
+    timings.count(name, amount)
+
+def timedStage(name):
+    """
+    REQUIRES:
+    - name: stage name
+
+    EFFECTS: decorator that times every call of the decorated function as the named stage of timings
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with timings.stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+def profileFolder():
+    """
+    EFFECTS: returns the folder where timing reports are written (inside outputDataFolder)
+    """
+    return os.path.join(configs["outputDataFolder"], "profile")
+
+def writeProfile(name, report):
+    """
+    REQUIRES:
+    - name: report name, used as the file name (ex. rotation name)
+    - report: json serializable dict
+
+    EFFECTS: writes the report to profileFolder()/[name].json
+    """
+    folder = profileFolder()
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok = True)
+
+    with open(os.path.join(folder, f"{name}.json"), "w") as file:
+        json.dump(report, file, indent = 4)
+
+@contextmanager
+def profiledRun(name):
+    """
+    REQUIRES:
+    - name: name of the profiled unit of work (ex. rotation name)
+
+    EFFECTS: resets timings, runs the with block as the "total" stage and, if configs["profile"] is set,
+    writes the timing report to profileFolder()/[name].json. If configs["profileStats"] is also set, the
+    block is run under cProfile and its stats are dumped to profileFolder()/[name].prof (see pstats).
+    """
+    timings.reset()
+    profiler = None
+    if configs["profile"] and configs["profileStats"]:
+        profiler = cProfile.Profile()
+
+    try:
+        with stage("total"):
+            if profiler is not None:
+                profiler.enable()
+            try:
+                yield
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+    finally:
+        if configs["profile"]:
+            writeProfile(name, dict(name = name, **timings.report()))
+
+            if profiler is not None:
+                profiler.dump_stats(os.path.join(profileFolder(), f"{name}.prof"))
@@ -0,0 +1,144 @@
+import numpy as np
+from config_local import *
+
+# NOTE: difference matrices here are (R, V) arrays, item [r, v] is the difference value of run r for variable v
+
+def orientScores(scores, method):
+    """
+    REQUIRES:
+    - scores: array of difference values
+    - method: difference calculation method (see data_utils.difference_sim_obs)
+
+    EFFECTS: returns the scores oriented so lower is better. Spearman cc is best when closest
+    to 1/-1 and becomes 1 - |scc|, other methods are returned as floats unchanged. NaN stays NaN.
+    """
+    scores = np.asarray(scores, dtype = np.float64)
+
+    if method == "scc":
+        return 1 - np.abs(scores)
+
+    return scores
+
+def normalizeScores(scores, method):
+    """
+    REQUIRES:
+    - scores: (R, V) difference matrix
+    - method: difference calculation method
+
+    EFFECTS: returns the scores min-max normalized per variable (column). Spearman cc and curve
+    distance are returned unchanged. NaN values are ignored for the min and max and stay NaN,
+    a variable where every run has the same value becomes NaN.
+    """
+    scores = np.asarray(scores, dtype = np.float64)
+
+    if method == "scc" or method == "curve_distance":
+        return scores
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        minValues = np.nanmin(scores, axis = 0)
+        return (scores - minValues) / (np.nanmax(scores, axis = 0) - minValues)
+
+def averageScores(scores, method):
+    """
+    REQUIRES:
+    - scores: (R, V) difference matrix
+    - method: difference calculation method
+
+    EFFECTS: returns the (R,) average of each run's oriented scores over all variables
+    """
+    scores = orientScores(scores, method)
+
+    # variables are summed one after the other (not pairwise), like the original calculate2DArrayAverage
+    return np.add.reduce(np.ascontiguousarray(scores.T), axis = 0) / scores.shape[1]
+
+def rankScores(scores, method):
+    """
+    REQUIRES:
+    - scores: (R, V) difference matrix
+    - method: difference calculation method
+
+    EFFECTS: returns the (R, V) rank of each run per variable, 1 is the best run. Runs with a NaN
+    value all get rank R + 1.
+
+    NOTE: NaN values take the first ranks before they are replaced, so the best valid run of a
+    variable with NaN values is ranked 1 + (number of NaN runs)
+    """
+    scores = orientScores(scores, method)
+
+    # NaN values are sorted as -inf, like the original findPlotOpacities
+    missing = np.isnan(scores)
+    scores = np.where(missing, -np.inf, scores)
+
+    sortedIndices = np.argsort(scores, axis = 0)
+    ranks = np.empty_like(sortedIndices)
+    np.put_along_axis(ranks, sortedIndices, np.arange(1, len(scores) + 1)[:, None], axis = 0)
+
+    ranks[missing] = len(scores) + 1
+
+    return ranks
+
+def scoreOpacities(scores, method, opacityRange = None):
+    """
+    REQUIRES:
+    - scores: (R, V) difference matrix
+    - method: difference calculation method
+    - opacityRange (default = configs["simLineOpacityRange"]): [min, max] opacity
+
+    EFFECTS: returns the (R, V) plot opacity of each run per variable, interpolated linearly
+    from the max opacity (rank 1) to the min opacity (the variable's last rank)
+    """
+    if opacityRange is None:
+        opacityRange = configs["simLineOpacityRange"]
+
+    minOpacity, maxOpacity = opacityRange
+    ranks = rankScores(scores, method)
+
+    # calculate difference in opacity between 2 ranks, the last rank of each variable gets the min opacity
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        opacityStep = (maxOpacity - minOpacity) / np.max(ranks - 1, axis = 0)
+
+    return maxOpacity - opacityStep * (ranks - 1)
+
+def bestScoreIndex(values, method, oriented = False):
+    """
+    REQUIRES:
+    - values: (R,) difference values, one per run
+    - method: difference calculation method
+    - oriented (default = false): whether the values are already oriented (ex. averageScores),
+    they're then not oriented a second time
+
+    EFFECTS: returns the index of the best (lowest oriented) value, the first one on ties.
+    NaN values are never picked unless all values are NaN.
+    """
+    if not oriented:
+        values = orientScores(values, method)
+    return int(np.argmin(np.where(np.isnan(values), np.inf, values)))
+
+def rankRuns(rawScores, variables, importantVariables, method):
+    """
+    REQUIRES:
+    - rawScores: (R, V) difference matrix, columns ordered like variables
+    - variables: names of the matrix's variables (ex. dataToPlot)
+    - importantVariables: variables used to find the overall best run (ex. importantParams)
+    - method: difference calculation method
+
+    EFFECTS: returns a dict with:
+    - normalized: (R, V) normalized scores (see normalizeScores)
+    - important: (R, I) normalized scores of the important variables only
+    - averages: (R,) average of the important scores of each run (see averageScores)
+    - bestIndex: index of the overall best run (see bestScoreIndex)
+    - opacities: (R, V) plot opacity of each run per variable, from the raw scores (see scoreOpacities)
+    """
+    normalized = normalizeScores(rawScores, method)
+    important = normalized[:, [variables.index(variable) for variable in importantVariables]]
+    averages = averageScores(important, method)
+
+    return {
+        "normalized": normalized,
+        "important": important,
+        "averages": averages,
+        # the averages are already oriented. The original indexOfMinValue(calculate2DArrayAverage(...))
+        # oriented them a second time, which picked the worst run for scc
+        "bestIndex": bestScoreIndex(averages, method, oriented = True),
+        "opacities": scoreOpacities(rawScores, method)
+    }
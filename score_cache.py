@@ -0,0 +1,88 @@
+import os
+import json
+from config_local import *
+from data_cache import runFingerprint
+from data_utils import atomicWrite, scoreVersion
+
+def scoreCacheFolder():
+    """
+    EFFECTS: returns the folder where rotations' scores are stored (inside outputDataFolder)
+    """
+    return os.path.join(configs["outputDataFolder"], "score_cache")
+
+def scoreStorePath(rotation):
+    """
+    REQUIRES:
+    - rotation: rotation name (ex. 20120516)
+
+    EFFECTS: returns the path of the rotation's score store
+    """
+    return os.path.join(scoreCacheFolder(), f"{rotation}.json")
+
+def scoreSettings():
+    """
+    EFFECTS: returns the configs (and the version of the difference code, see data_utils.scoreVersion)
+    the stored difference values depend on. Stored scores are only reused while these are unchanged.
+    """
+    return {
+        "scoreVersion": scoreVersion,
+        "diffCalcMethod": configs["diffCalcMethod"],
+        "dataToPlot": list(configs["dataToPlot"]),
+        "varsToScrape": list(configs["varsToScrape"])
+    }
+
+def readScoreStore(rotation):
+    """
+    REQUIRES:
+    - rotation: rotation name (ex. 20120516)
+
+    EFFECTS: returns a dict of run name -> stored score entry (see writeScoreStore), or an empty
+    dict if the rotation has no store or it was written with different settings
+    """
+    try:
+        with open(scoreStorePath(rotation), "r") as file:
+            store = json.load(file)
+
+        if store["settings"] != scoreSettings():
+            return dict()
+
+        return store["runs"]
+    except (OSError, ValueError, KeyError):
+        # missing or unreadable stores are treated as empty
+        return dict()
+
+def writeScoreStore(rotation, runs):
+    """
+    REQUIRES:
+    - rotation: rotation name (ex. 20120516)
+    - runs: dict of run name -> {"fingerprint", "poyntingFlux", "scrapeWindow", "rawDiffValues"},
+    where rawDiffValues has one difference value per var in dataToPlot
+
+    EFFECTS: replaces the rotation's score store with the given runs
+    """
+    folder = scoreCacheFolder()
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok = True)
+
+    store = {"settings": scoreSettings(), "runs": runs}
+    atomicWrite(scoreStorePath(rotation), lambda file: json.dump(store, file), "w")
+
+def staleRuns(runResults, store, fingerprints):
+    """
+    REQUIRES:
+    - runResults: runs of one rotation (rotationData[rotation])
+    - store: stored score entries of the rotation (see readScoreStore)
+    - fingerprints: dict of run name -> current fingerprint (see data_cache.runFingerprint)
+
+    EFFECTS: returns the names of the runs that are new or have changed since they were stored
+    """
+    return [run for run in runResults if run not in store or store[run]["fingerprint"] != fingerprints[run]]
+
+def runFingerprints(runResults):
+    """
+    REQUIRES:
+    - runResults: runs of one rotation, as a data_index.RotationRuns
+
+    EFFECTS: returns a dict of run name -> fingerprint of the run's files, without loading any run
+    """
+    return {run: runFingerprint(runResults.runFolder(run)) for run in runResults}
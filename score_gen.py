@@ -0,0 +1,283 @@
+from config_local import *
+import numpy as np
+from scrape_data import scrapeData, prefetchData
+from data_utils import *
+from data_index import RotationRuns
+from score_cache import *
+from flux_fit import *
+from ranking import rankRuns
+from profiling import timedStage
+
+# NOTE: this module must not import matplotlib, it is used on its own by --score-only
+
+def scrapeWindow(simTimestamps):
+    """
+    REQUIRES:
+    - simTimestamps: datetime64 array with a run's timestamps
+
+    EFFECTS: returns [startTime, alteredStartTime, alteredEndTime] as '%Y-%m-%d %H:%M:%S' strings.
+    The altered (scraping) timeframe is shifted back by 4.5 hours to account for delay in
+    start/end of data collection vs sim timeframe
+    """
+    startTime = simTimestamps.min().astype("datetime64[s]")
+    endTime = simTimestamps.max().astype("datetime64[s]")
+    shift = np.timedelta64(int(4.5 * 3600), "s")
+
+    return [formatTimestamp(startTime), formatTimestamp(startTime - shift), formatTimestamp(endTime - shift)]
+
+@timedStage("scoring")
+def scoreRotation(plotRotation, rotationData, writeDataFile = True):
+    """
+    REQUIRES:
+    - plotRotation: string with the rotation name to score (ex. 20140902)
+    - rotationData: dict containing data for ALL rotations, format specified in main file
+    - writeDataFile (default = true): whether or not to write the difference table to outputDataFolder
+
+    EFFECTS: calculates the difference between every run of the rotation and the scraped
+    observations, ranks the runs and returns a dict with:
+    - runNames, poyntingFluxes: run names and poynting flux values (as in key_params), in run order
+    - scrapeWindows: [startTime, alteredStartTime, alteredEndTime] of each run (see scrapeWindow)
+    - rawDiffValues: difference values for each var in dataToPlot, before normalization
+    - diffValues: normalized difference values for each var in dataToPlot
+    - filteredDiffValues: diffValues of the importantParams only
+    - diffAverages: average of filteredDiffValues for each run
+    - bestIndex, bestRunName, bestPoyntingFlux: the overall best run
+    - fluxFit: interpolated best poynting flux and next fluxes to simulate (see flux_fit.fitOptimalFlux)
+
+    All difference value lists are indexed like runNames.
+
+    Raw difference values are kept in the rotation's score store (see score_cache), so only
+    runs that are new or have changed since the last call are loaded and scored. Normalization
+    and ranking are always redone over all runs.
+    """
+    runResults = rotationData[plotRotation]
+    dataToPlot = configs["dataToPlot"]
+
+    runNames = list(runResults)
+    store, fingerprints = storedScores(plotRotation, runResults)
+    runsToScore = set(staleRuns(runResults, store, fingerprints))
+
+    if len(runsToScore) < len(runNames):
+        print(f"Reusing stored scores of {len(runNames) - len(runsToScore)} run(s), scoring {len(runsToScore)} new or changed run(s)")
+
+    poyntingFluxes = []
+    scrapeWindows = []
+    diffMatrix = np.empty((len(runNames), len(dataToPlot)))
+
+    # epoch second timestamps and values (one array per variable in dataToPlot) of every run to score
+    simTimestampsByRun = dict()
+    simValuesByRun = dict()
+
+    for runIndex, run in enumerate(runNames):
+        # unchanged runs are taken from the score store without loading their results
+        if run not in runsToScore:
+            poyntingFluxes.append(store[run]["poyntingFlux"])
+            scrapeWindows.append(store[run]["scrapeWindow"])
+            diffMatrix[runIndex] = store[run]["rawDiffValues"]
+            continue
+
+        poyntingFluxes.append(runResults[run]["poyntingFlux"])
+        scrapeWindows.append(scrapeWindow(runResults[run]["timestamp"]))
+
+        #normalize timestamps into int format (for calculating line differences)
+        simTimestampsByRun[runIndex] = toEpochSeconds(runResults[run]["timestamp"])
+        simValuesByRun[runIndex] = [runResults[run][data] for data in dataToPlot]
+
+    #--DIFF CALCULATION--
+    #runs with the same scraping timeframe are compared against the same observations,
+    #so all runs of a timeframe are scored against all variables in one call
+    runsByWindow = dict()
+    for runIndex in simTimestampsByRun:
+        startTime, alteredStartTime, alteredEndTime = scrapeWindows[runIndex]
+        runsByWindow.setdefault((alteredStartTime, alteredEndTime), []).append(runIndex)
+
+    #fetches the union of all runs' timeframes up front, each timeframe is then sliced out of it
+    if len(runsByWindow) > 0:
+        prefetchData(configs["varsToScrape"], list(runsByWindow.keys()))
+
+    for (alteredStartTime, alteredEndTime), runIndices in runsByWindow.items():
+        # scrapeData caches requests so repeat requests are returned immediately w/o scraping
+        scrapedData = scrapeData(configs["varsToScrape"], alteredStartTime, alteredEndTime)
+
+        #normalize timestamps into int format, all scraped variables share the same timestamps
+        dataTimestamps = toEpochSeconds(scrapedData[configs["varsToScrape"][0]]["timestamps"])
+        dataValues = [scrapedData[dataVar]["data"] for dataVar in configs["varsToScrape"]]
+
+        #calculate difference with given method
+        diffMatrix[runIndices] = difference_matrix(
+            [simTimestampsByRun[runIndex] for runIndex in runIndices],
+            [simValuesByRun[runIndex] for runIndex in runIndices],
+            dataTimestamps, dataValues, configs["diffCalcMethod"]
+        )
+
+    if len(fingerprints) > 0 and len(runsToScore) > 0:
+        writeScoreStore(plotRotation, {
+            run: {
+                "fingerprint": fingerprints[run],
+                "poyntingFlux": poyntingFluxes[runIndex],
+                "scrapeWindow": scrapeWindows[runIndex],
+                "rawDiffValues": [float(value) for value in diffMatrix[runIndex]]
+            }
+            for runIndex, run in enumerate(runNames)
+        })
+
+    rawDiffValues = [list(diffMatrix[:, i]) for i in range(len(dataToPlot))]
+
+    # normalizes each variable's difference values, then finds overall best run from the important params only
+    # (other params will be ignored in the calculation)
+    ranked = rankRuns(diffMatrix, dataToPlot, configs["importantParams"], configs["diffCalcMethod"])
+    diffValues = [list(ranked["normalized"][:, i]) for i in range(len(dataToPlot))]
+    filteredDiffValues = [list(ranked["important"][:, i]) for i in range(len(configs["importantParams"]))]
+    diffAverages = list(ranked["averages"])
+    bestIndex = ranked["bestIndex"]
+
+    scores = {
+        "runNames": runNames,
+        "poyntingFluxes": poyntingFluxes,
+        "scrapeWindows": scrapeWindows,
+        "rawDiffValues": rawDiffValues,
+        "diffValues": diffValues,
+        "filteredDiffValues": filteredDiffValues,
+        "diffAverages": diffAverages,
+        "bestIndex": bestIndex,
+        "plotOpacities": ranked["opacities"],
+        "bestRunName": runNames[bestIndex],
+        "bestPoyntingFlux": poyntingFluxes[bestIndex],
+        "fluxFit": fitOptimalFlux([float(poyntingFlux) for poyntingFlux in poyntingFluxes], diffAverages, float(poyntingFluxes[bestIndex]))
+    }
+
+    if writeDataFile:
+        writeScoreTable(plotRotation, scores)
+        writeFluxFit(plotRotation, scores["fluxFit"])
+
+    return scores
+
+def storedScores(plotRotation, runResults):
+    """
+    REQUIRES:
+    - plotRotation: rotation name
+    - runResults: runs of the rotation (rotationData[plotRotation])
+
+    EFFECTS: returns [store, fingerprints] of the rotation (see score_cache). Both are empty
+    if the runs aren't indexed from a sim directory or the parsed data cache is disabled,
+    and the store is empty when the cache is being rebuilt.
+    """
+    if not isinstance(runResults, RotationRuns) or not runResults.useCache:
+        return [dict(), dict()]
+
+    fingerprints = runFingerprints(runResults)
+    if runResults.rebuildCache:
+        return [dict(), fingerprints]
+
+    return [readScoreStore(plotRotation), fingerprints]
+
+def runsToScore(plotRotation, rotationData):
+    """
+    REQUIRES:
+    - plotRotation: rotation name
+    - rotationData: dict containing data for ALL rotations, format specified in main file
+
+    EFFECTS: returns the runs of the rotation whose results are needed by scoreRotation,
+    ie. the runs without up to date stored scores
+    """
+    runResults = rotationData[plotRotation]
+    store, fingerprints = storedScores(plotRotation, runResults)
+
+    return staleRuns(runResults, store, fingerprints)
+
+def scoreTable(scores):
+    """
+    REQUIRES:
+    - scores: result of scoreRotation
+
+    EFFECTS: returns [header, rows] of the rotation's difference table, one row per run with its
+    poynting flux, each variable's (normalized) difference value and the average of the important ones
+    """
+    diffValues = scores["diffValues"]
+    filteredDiffValues = scores["filteredDiffValues"]
+
+    header = ["Poynting_flux", "Dist_U", "Dist_N", "Dist_T", "Dist_B", "ave_un"]
+    rows = []
+
+    for i, poyntingFlux in enumerate(scores["poyntingFluxes"]):
+        # consistent poynting flux values across all variables
+        row = [poyntingFlux] + [valueSet[i] for valueSet in diffValues]
+
+        filteredDiffAvg = 0
+        for valueSet in filteredDiffValues:
+            filteredDiffAvg += valueSet[i]
+
+        row.append(filteredDiffAvg / len(filteredDiffValues))
+        rows.append(row)
+
+    return [header, rows]
+
+def writeScoreTable(plotRotation, scores):
+    """
+    REQUIRES:
+    - plotRotation: rotation name, used as the output file name
+    - scores: result of scoreRotation
+
+    EFFECTS: writes the rotation's difference table (see scoreTable) to outputDataFolder/[plotRotation].txt
+    """
+    header, rows = scoreTable(scores)
+
+    dataFile = datafile(plotRotation)
+    dataFile.add("\t".join(header))
+    dataFile.newLine()
+
+    # send data to text output file
+    for row in rows:
+        dataFile.add(row[0])
+        for value in row[1:]:
+            dataFile.add(round(value, 4))
+        dataFile.newLine()
+
+    dataFile.close()
+
+def scoreRotations(rotationData, rotations):
+    """
+    REQUIRES:
+    - rotationData: dict containing data for ALL rotations, format specified in main file
+    - rotations: names of the rotations to score
+
+    EFFECTS: scores each rotation (see scoreRotation), writes its difference table and
+    prints the best run, without rendering any plots. Returns a dict of rotation name -> scores.
+    """
+    allScores = dict()
+
+    for plotRotation in rotations:
+        print(f"\n[Rotation = {plotRotation}] Scoring {len(rotationData[plotRotation])} simulation results ...")
+
+        scores = scoreRotation(plotRotation, rotationData)
+        allScores[plotRotation] = scores
+
+        print(f"Best simulation run: {scores['bestRunName']} (poyntingFlux = {scores['bestPoyntingFlux']})")
+        print(fluxFitSummary(scores["fluxFit"]))
+
+    return allScores
+
+def observationTimeframes(runResults):
+    """
+    REQUIRES:
+    - runResults: runs of one rotation (rotationData[rotation])
+
+    EFFECTS: returns the set of (alteredStartTime, alteredEndTime) scraping timeframes of the runs
+    """
+    timeframes = set()
+    for run in runResults:
+        startTime, alteredStartTime, alteredEndTime = scrapeWindow(runResults[run]["timestamp"])
+        timeframes.add((alteredStartTime, alteredEndTime))
+
+    return timeframes
+
+def seedObservationCache(timeframes):
+    """
+    REQUIRES:
+    - timeframes: scraping timeframes to seed, ex. of every run in a campaign (see observationTimeframes)
+
+    EFFECTS: scrapes the observations of all timeframes into the on-disk cache with as few requests as
+    possible, so later (ex. offline) runs don't need to connect to CDAWeb
+    """
+    requests = prefetchData(configs["varsToScrape"], list(timeframes))
+    print(f"Cached observations for {len(timeframes)} timeframe(s) with {requests} request(s)")
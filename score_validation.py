@@ -0,0 +1,220 @@
+import os
+import json
+import numpy as np
+from config_local import *
+from data_utils import atomicWrite
+from ranking import orientScores, bestScoreIndex
+from score_gen import scoreRotation, scoreTable
+
+# NOTE: like score_gen, this module must not import matplotlib
+
+def validationFixtureFolder():
+    """
+    EFFECTS: returns the folder of the recorded observations used by --validate (inside validationFolder),
+    laid out like the observation cache (see scrape_data.observationCacheFile)
+    """
+    return os.path.join(configs["validationFolder"], "omni")
+
+def referenceTablePath(rotation):
+    """
+    REQUIRES:
+    - rotation: rotation name (ex. 20160303)
+
+    EFFECTS: returns the path of the rotation's reference difference table
+    """
+    return os.path.join(configs["validationFolder"], f"{rotation}.txt")
+
+def referenceRotations():
+    """
+    EFFECTS: returns the sorted names of all rotations with a reference table in validationFolder
+    """
+    folder = configs["validationFolder"]
+    if not os.path.isdir(folder):
+        return []
+
+    return sorted(os.path.splitext(fileName)[0] for fileName in os.listdir(folder) if fileName.endswith(".txt"))
+
+def readReferenceTable(path):
+    """
+    REQUIRES:
+    - path: whitespace separated table with a header row (ex. validation/20160303.txt)
+
+    EFFECTS: returns [header, values] where values is a (rows, columns) float array.
+    Values equal to configs["validationMissingValue"] are replaced with nan.
+    """
+    with open(path, "r") as file:
+        header = file.readline().split()
+
+    values = np.loadtxt(path, skiprows = 1, ndmin = 2)
+    values[values == configs["validationMissingValue"]] = np.nan
+
+    return [header, values]
+
+def fluxValues(fluxes, values):
+    """
+    REQUIRES:
+    - fluxes, values: arrays of equal length, a poynting flux and value per row
+
+    EFFECTS: returns [uniqueFluxes, meanValues] with the values of rows of the same flux
+    (ex. realizations of one run) averaged, ignoring nan
+    """
+    uniqueFluxes, inverse = np.unique(fluxes, return_inverse = True)
+    meanValues = np.full(len(uniqueFluxes), np.nan)
+
+    for i in range(len(uniqueFluxes)):
+        rowValues = values[inverse == i]
+        rowValues = rowValues[~np.isnan(rowValues)]
+        if len(rowValues) > 0:
+            meanValues[i] = np.mean(rowValues)
+
+    return [uniqueFluxes, meanValues]
+
+def matchFlux(fluxes, flux):
+    """
+    REQUIRES:
+    - fluxes: array of poynting flux values
+    - flux: poynting flux value
+
+    EFFECTS: returns the index of the first value of fluxes equal to flux (up to float formatting), or -1
+    """
+    matching = np.flatnonzero(np.isclose(fluxes, flux, rtol = 1e-6, atol = 0))
+    return int(matching[0]) if len(matching) > 0 else -1
+
+def compareScoreTable(header, rows, referenceHeader, reference, method):
+    """
+    REQUIRES:
+    - header, rows: difference table of a rotation (see score_gen.scoreTable)
+    - referenceHeader, reference: reference table of the rotation (see readReferenceTable)
+    - method: difference calculation method
+
+    EFFECTS: compares every value of the table with the reference row of the same poynting flux and
+    returns a report dict with:
+    - columns: per compared column, the number of compared values, failed values and the max abs error
+    - failures: [poynting flux, column, value, reference value] of each value outside the tolerance
+    (|value - reference| > validationAbsTolerance + validationRelTolerance * |reference|)
+    - unmatchedFluxes: poynting fluxes of runs without a reference row
+    - missingFluxes: poynting fluxes of valid reference rows without a run
+    - referenceBestFlux, bestFlux: best poynting flux of the reference and of the table, by ave_un
+    - bestFluxRank: rank of the reference's best flux in the table (1 = same best flux), None if it wasn't run
+    - rankCorrelation: spearman cc of the table's and the reference's ave_un per poynting flux
+    - passed: whether no value failed and bestFluxRank is at most validationMaxBestRank
+    """
+    absTolerance = configs["validationAbsTolerance"]
+    relTolerance = configs["validationRelTolerance"]
+
+    fluxes = np.array([float(row[0]) for row in rows])
+    referenceFluxes = reference[:, referenceHeader.index("Poynting_flux")]
+
+    # reference row of each run, -1 if its poynting flux isn't in the reference
+    matches = np.array([matchFlux(referenceFluxes, flux) for flux in fluxes], dtype = int)
+
+    report = {"columns": dict(), "failures": []}
+
+    for j, column in enumerate(header):
+        if column == "Poynting_flux" or column not in referenceHeader:
+            continue
+
+        values = np.array([float(row[j]) for row in rows])
+        referenceValues = np.full(len(fluxes), np.nan)
+        referenceValues[matches >= 0] = reference[matches[matches >= 0], referenceHeader.index(column)]
+
+        # missing reference values are skipped, a missing value with a valid reference fails
+        compared = ~np.isnan(referenceValues)
+        errors = np.abs(values - referenceValues)
+        failed = compared & ~(errors <= absTolerance + relTolerance * np.abs(referenceValues))
+
+        report["columns"][column] = {
+            "compared": int(np.count_nonzero(compared)),
+            "failed": int(np.count_nonzero(failed)),
+            "maxError": float(np.nanmax(errors[compared])) if compared.any() else None
+        }
+
+        for i in np.flatnonzero(failed):
+            report["failures"].append([float(fluxes[i]), column, float(values[i]), float(referenceValues[i])])
+
+    averageColumn = "ave_un"
+    referenceAverages = reference[:, referenceHeader.index(averageColumn)]
+    validReference = ~np.isnan(referenceAverages)
+
+    report["unmatchedFluxes"] = sorted(set(float(flux) for flux in fluxes[matches < 0]))
+    report["missingFluxes"] = [float(flux) for flux in referenceFluxes[validReference] if matchFlux(fluxes, flux) < 0]
+
+    # runs are ranked per poynting flux, realizations of the same flux are averaged
+    uniqueFluxes, averages = fluxValues(fluxes, np.array([float(row[header.index(averageColumn)]) for row in rows]))
+    oriented = orientScores(averages, method)
+
+    referenceBestFlux = None
+    bestFluxRank = None
+    if validReference.any():
+        referenceBestFlux = float(referenceFluxes[bestScoreIndex(referenceAverages, method)])
+
+        best = matchFlux(uniqueFluxes, referenceBestFlux)
+        if best >= 0 and not np.isnan(oriented[best]):
+            # nan averages are ranked last
+            bestFluxRank = 1 + int(np.count_nonzero(oriented < oriented[best]))
+
+    # rank correlation over the poynting fluxes valid in both tables
+    referenceUnique, referenceMeans = fluxValues(referenceFluxes, referenceAverages)
+    referenceAtFlux = np.full(len(uniqueFluxes), np.nan)
+    for i, flux in enumerate(uniqueFluxes):
+        match = matchFlux(referenceUnique, flux)
+        if match >= 0:
+            referenceAtFlux[i] = referenceMeans[match]
+
+    both = ~np.isnan(averages) & ~np.isnan(referenceAtFlux)
+    rankCorrelation = None
+    if np.count_nonzero(both) > 2:
+        from scipy.stats import spearmanr
+        rankCorrelation = float(spearmanr(orientScores(averages[both], method), orientScores(referenceAtFlux[both], method))[0])
+
+    report["referenceBestFlux"] = referenceBestFlux
+    report["bestFlux"] = float(uniqueFluxes[bestScoreIndex(averages, method)]) if len(uniqueFluxes) > 0 else None
+    report["bestFluxRank"] = bestFluxRank
+    report["rankCorrelation"] = rankCorrelation
+    report["passed"] = len(report["failures"]) == 0 and bestFluxRank is not None and bestFluxRank <= configs["validationMaxBestRank"]
+
+    return report
+
+def validateRotation(rotation, rotationData):
+    """
+    REQUIRES:
+    - rotation: rotation with sim data and a reference table (see referenceRotations)
+    - rotationData: dict of rotation name -> RotationRuns, with the rotation's runs loaded
+
+    EFFECTS: scores the rotation, compares its difference table with the reference table (see compareScoreTable)
+    and writes the report to outputDataFolder/[rotation]_validation.json. Returns the report.
+    """
+    method = configs["diffCalcMethod"]
+    scores = scoreRotation(rotation, rotationData, writeDataFile = False)
+    header, rows = scoreTable(scores)
+    referenceHeader, reference = readReferenceTable(referenceTablePath(rotation))
+
+    report = dict(rotation = rotation, method = method, **compareScoreTable(header, rows, referenceHeader, reference, method))
+
+    path = os.path.join(configs["outputDataFolder"], f"{rotation}_validation.json")
+    atomicWrite(path, lambda file: json.dump(report, file, indent = 4), "w")
+
+    return report
+
+def validationSummary(report):
+    """
+    REQUIRES:
+    - report: result of validateRotation
+
+    EFFECTS: returns a short multi-line description of the report
+    """
+    lines = []
+    for column, result in report["columns"].items():
+        maxError = "-" if result["maxError"] is None else f"{result['maxError']:.4f}"
+        lines.append(f"  {column}: {result['compared'] - result['failed']}/{result['compared']} within tolerance (max error {maxError})")
+
+    rankCorrelation = "-" if report["rankCorrelation"] is None else f"{report['rankCorrelation']:.3f}"
+    lines.append(f"  Best poyntingFlux: {report['bestFlux']} (reference: {report['referenceBestFlux']}, rank {report['bestFluxRank']}), rank correlation {rankCorrelation}")
+
+    if len(report["missingFluxes"]) > 0:
+        lines.append(f"  Reference poyntingFlux values without runs: {report['missingFluxes']}")
+    if len(report["unmatchedFluxes"]) > 0:
+        lines.append(f"  Runs without reference values: {report['unmatchedFluxes']}")
+
+    lines.append("  PASSED" if report["passed"] else "  FAILED")
+    return "\n".join(lines)
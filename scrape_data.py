@@ -1,11 +1,296 @@
-from cdasws import CdasWs
-cdas = CdasWs()
+from config_local import *
+from data_utils import atomicWrite
+from profiling import stage, count, timedStage
+from datetime import datetime, timedelta
+import numpy as np
+import os
+import time
 import warnings
 
 # pip install -u xarray cdflib cdasws
 
+OMNI_DATASET = "OMNI_COHO1HR_MERGED_MAG_PLASMA"
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# exact requests -> scraped data
 cachedData = dict()
+# requests held in memory as [vars, startTime, endTime, scrapedData], used to serve any request
+# inside their timeframe by slicing (see findCachedInterval)
+cachedIntervals = []
+
+# CDAWeb client, created on the first request that isn't cached (see getCdasClient)
+cdas = None
+
+def getCdasClient():
+    """
+    EFFECTS: returns the CDAWeb client, creating it on first use.
+    cdasws is only imported here, so cached and offline runs don't need it.
+    """
+    global cdas
+
+    if cdas is None:
+        from cdasws import CdasWs
+        cdas = CdasWs()
+
+    return cdas
+
+def setCdasClient(client):
+    """
+    REQUIRES:
+    - client: object with a CdasWs-compatible get_data(dataset, vars, startTime, endTime) method
+
+    EFFECTS: replaces the CDAWeb client, ex. with a local stand-in so the pipeline runs without network
+    """
+    global cdas
+    cdas = client
+
+def omniCacheFolder():
+    """
+    EFFECTS: returns the folder where scraped observations are cached (configs["omniCacheFolder"], inside
+    outputDataFolder unless absolute), or None if the on-disk cache is disabled
+    """
+    if configs["omniCacheFolder"] is None:
+        return None
+
+    return os.path.join(configs["outputDataFolder"], configs["omniCacheFolder"])
+
+def observationCacheFile(var, startTime, endTime):
+    """
+    REQUIRES:
+    - var: scraped variable name
+    - startTime, endTime: timeframe of the request ('%Y-%m-%d %H:%M:%S')
+
+    EFFECTS: returns the path of the on-disk cache file for one variable and timeframe
+    """
+    timeFormat = lambda t: datetime.strptime(t, TIME_FORMAT).strftime('%Y%m%dT%H%M%S')
+
+    return os.path.join(omniCacheFolder(), f"{OMNI_DATASET}_{var}_{timeFormat(startTime)}_{timeFormat(endTime)}.npz")
+
+def cachedFileTimeframe(fileName, var):
+    """
+    REQUIRES:
+    - fileName: name of a file in the on-disk cache
+    - var: scraped variable name
+
+    EFFECTS: returns [startTime, endTime] (datetimes) of the file if it holds data for var, otherwise None
+    """
+    prefix = f"{OMNI_DATASET}_{var}_"
+    if not fileName.startswith(prefix) or not fileName.endswith(".npz"):
+        return None
+
+    timeframe = fileName[len(prefix):-len(".npz")].split("_")
+    if len(timeframe) != 2:
+        return None
+
+    try:
+        return [datetime.strptime(t, '%Y%m%dT%H%M%S') for t in timeframe]
+    except ValueError:
+        return None
+
+def sliceData(scrapedData, vars, startTime, endTime):
+    """
+    REQUIRES:
+    - scrapedData: scraped data covering the timeframe (see scrapeData)
+    - vars: variables to keep
+    - startTime, endTime: timeframe to keep ('%Y-%m-%d %H:%M:%S')
+
+    EFFECTS: returns the data of vars with timestamps inside [startTime, endTime], in the scrapeData format
+    """
+    start = np.datetime64(datetime.strptime(startTime, TIME_FORMAT))
+    end = np.datetime64(datetime.strptime(endTime, TIME_FORMAT))
+
+    slicedData = dict()
+    for var in vars:
+        timestamps = scrapedData[var]["timestamps"]
+        mask = (timestamps >= start) & (timestamps <= end)
+
+        slicedData[var] = {
+            "data": scrapedData[var]["data"][mask],
+            "timestamps": timestamps[mask]
+        }
+
+    return slicedData
+
+def findCachedInterval(vars, startTime, endTime):
+    """
+    REQUIRES:
+    - vars, startTime, endTime: request (see scrapeData)
+
+    EFFECTS: returns the request's data sliced from a request held in memory that includes all vars
+    and covers the whole timeframe, or None if there is no such request
+    """
+    start = datetime.strptime(startTime, TIME_FORMAT)
+    end = datetime.strptime(endTime, TIME_FORMAT)
+
+    for cachedVars, cachedStart, cachedEnd, scrapedData in cachedIntervals:
+        if set(vars) <= set(cachedVars) and cachedStart <= start and end <= cachedEnd:
+            return sliceData(scrapedData, vars, startTime, endTime)
+
+    return None
+
+def clearCachedData():
+    """
+    EFFECTS: frees the requests held in memory (cachedData and cachedIntervals). Later requests are
+    served from the on-disk cache, or scraped again if it is disabled.
+    """
+    cachedData.clear()
+    cachedIntervals.clear()
+
+def isExpired(path):
+    """
+    REQUIRES:
+    - path: existing cache file
+
+    EFFECTS: returns whether the file is older than configs["omniCacheTTLDays"] (None = never expires).
+    Files deleted in the meantime (ex. evicted by another process) count as expired.
+    """
+    ttlDays = configs["omniCacheTTLDays"]
+    if ttlDays is None:
+        return False
+
+    try:
+        modifiedTime = os.path.getmtime(path)
+    except FileNotFoundError:
+        return True
+
+    return time.time() - modifiedTime > ttlDays * 24 * 3600
+
+def findObservationCacheFile(var, startTime, endTime, offline):
+    """
+    REQUIRES:
+    - var, startTime, endTime: request for one variable
+    - offline: if true, expired files are still used
+
+    EFFECTS: returns the path of the smallest valid cache file of var covering the timeframe, or None
+    """
+    folder = omniCacheFolder()
+    try:
+        fileNames = os.listdir(folder)
+    except FileNotFoundError:
+        return None
 
+    start = datetime.strptime(startTime, TIME_FORMAT)
+    end = datetime.strptime(endTime, TIME_FORMAT)
+
+    bestPath = None
+    bestLength = None
+    for fileName in fileNames:
+        timeframe = cachedFileTimeframe(fileName, var)
+        if timeframe is None or timeframe[0] > start or timeframe[1] < end:
+            continue
+
+        path = os.path.join(folder, fileName)
+        if not offline and isExpired(path):
+            continue
+
+        length = timeframe[1] - timeframe[0]
+        if bestLength is None or length < bestLength:
+            bestPath = path
+            bestLength = length
+
+    return bestPath
+
+@timedStage("omniCacheRead")
+def readObservationCache(vars, startTime, endTime, offline):
+    """
+    REQUIRES:
+    - vars, startTime, endTime: request (see scrapeData)
+    - offline: if true, expired files are still used
+
+    EFFECTS: returns the request's data from the on-disk cache in the scrapeData format, or None if any
+    variable is missing or expired. Each variable can be sliced from any cached timeframe covering the request.
+    """
+    scrapedData = dict()
+
+    for var in vars:
+        path = findObservationCacheFile(var, startTime, endTime, offline)
+        if path is None:
+            return None
+
+        try:
+            with np.load(path, allow_pickle = False) as cached:
+                scrapedData[var] = {
+                    "data": cached["data"],
+                    "timestamps": cached["timestamps"]
+                }
+        except (OSError, ValueError, KeyError):
+            # unreadable or partially written cache files are treated as a cache miss
+            return None
+
+        # marks the file as recently used for eviction (mtime is kept for the TTL)
+        try:
+            os.utime(path, (time.time(), os.path.getmtime(path)))
+        except FileNotFoundError:
+            # evicted by another process since it was read, its data is still valid
+            pass
+
+    return sliceData(scrapedData, vars, startTime, endTime)
+
+def writeObservationCache(scrapedData, startTime, endTime):
+    """
+    REQUIRES:
+    - scrapedData: data returned by a CDAWeb request (see scrapeData)
+    - startTime, endTime: timeframe of the request
+
+    EFFECTS: saves each variable of the request to its own cache file, then evicts old files
+    if the cache is larger than configs["omniCacheMaxMB"]
+    """
+    folder = omniCacheFolder()
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok = True)
+
+    for var, values in scrapedData.items():
+        atomicWrite(observationCacheFile(var, startTime, endTime),
+                    lambda file: np.savez(file, data = values["data"], timestamps = values["timestamps"]), "wb")
+
+    evictObservationCache()
+
+def evictObservationCache():
+    """
+    EFFECTS: deletes expired cache files, then the least recently used files until the cache
+    is no larger than configs["omniCacheMaxMB"] (None = unlimited)
+    """
+    folder = omniCacheFolder()
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return
+
+    # other processes may evict the same files concurrently, files already gone are skipped
+    files = []
+    for name in names:
+        path = os.path.join(folder, name)
+        if not name.endswith(".npz"):
+            continue
+
+        try:
+            if isExpired(path):
+                os.remove(path)
+                continue
+
+            stats = os.stat(path)
+        except FileNotFoundError:
+            continue
+
+        files.append([stats.st_atime, stats.st_size, path])
+
+    maxMB = configs["omniCacheMaxMB"]
+    if maxMB is None:
+        return
+
+    totalSize = sum(size for atime, size, path in files)
+    for atime, size, path in sorted(files):
+        if totalSize <= maxMB * 1024**2:
+            break
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        totalSize -= size
+
+@timedStage("observations")
 def scrapeData(vars, startTime, endTime):
     """
     REQUIRES:
@@ -13,16 +298,37 @@ def scrapeData(vars, startTime, endTime):
     - startTime, endTime: timeframe for which to return data
 
     EFFECTS: returns a formatted dict with scraped data from CDAS OMNI solar wind hourly average observations
-    
+
     Accessing returned data:
     - data["variable"]["data"]
     - data["variable"]["timestamps"]
+
+    Requests are cached in memory and on disk (see omniCacheFolder). When configs["omniOffline"]
+    is true, only cached data is returned and a missing request raises a ConnectionError.
     """
     # if an identical request was previously made and cached, return that instead of waiting to make a new request
     cacheKey = (tuple(vars), startTime, endTime)
     if cacheKey in cachedData:
         return cachedData[cacheKey]
-    
+
+    # if a previous request covers this one (see prefetchData), slice the data out of it
+    scrapedData = findCachedInterval(vars, startTime, endTime)
+    if scrapedData is not None:
+        cachedData[cacheKey] = scrapedData
+        return scrapedData
+
+    offline = configs["omniOffline"]
+
+    # then check the on-disk cache, which is shared between processes and program runs
+    if omniCacheFolder() is not None:
+        scrapedData = readObservationCache(vars, startTime, endTime, offline)
+        if scrapedData is not None:
+            cachedData[cacheKey] = scrapedData
+            return scrapedData
+
+    if offline:
+        raise ConnectionError(f"Offline mode: no cached {OMNI_DATASET} data for {list(vars)} from {startTime} to {endTime}")
+
     # otherwise, proceed with scraping new data...
 
     # we can hide the "UserWarning" generated by the time to nanosecond conversion issue as pandas
@@ -30,7 +336,9 @@ def scrapeData(vars, startTime, endTime):
     with warnings.catch_warnings():
         warnings.filterwarnings("ignore", category=UserWarning)
 
-        status, data = cdas.get_data("OMNI_COHO1HR_MERGED_MAG_PLASMA", vars, startTime, endTime)
+        with stage("cdawebFetch"):
+            status, data = getCdasClient().get_data(OMNI_DATASET, vars, startTime, endTime)
+        count("cdawebRequests")
 
         # check for errors when fetching data
         statusCode = status['http']['status_code']
@@ -47,5 +355,65 @@ def scrapeData(vars, startTime, endTime):
 
         # cache the newly scraped data
         cachedData[cacheKey] = scrapedData
-        
-        return scrapedData
\ No newline at end of file
+        cachedIntervals.append([tuple(vars), datetime.strptime(startTime, TIME_FORMAT), datetime.strptime(endTime, TIME_FORMAT), scrapedData])
+        if omniCacheFolder() is not None:
+            writeObservationCache(scrapedData, startTime, endTime)
+
+        return scrapedData
+
+def planFetches(timeframes, maxGapHours = None):
+    """
+    REQUIRES:
+    - timeframes: list of (startTime, endTime) requests ('%Y-%m-%d %H:%M:%S')
+    - maxGapHours (default = configs["omniMergeGapHours"]): timeframes separated by at most this
+      many hours are merged into one request
+
+    EFFECTS: returns the smallest list of (startTime, endTime) requests that covers every timeframe,
+    sorted by start time. Overlapping timeframes are always merged.
+    """
+    if maxGapHours is None:
+        maxGapHours = configs["omniMergeGapHours"]
+
+    intervals = sorted([datetime.strptime(start, TIME_FORMAT), datetime.strptime(end, TIME_FORMAT)] for start, end in timeframes)
+    maxGap = timedelta(hours = maxGapHours)
+
+    merged = []
+    for start, end in intervals:
+        if len(merged) > 0 and start - merged[-1][1] <= maxGap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    return [(start.strftime(TIME_FORMAT), end.strftime(TIME_FORMAT)) for start, end in merged]
+
+def prefetchData(vars, timeframes):
+    """
+    REQUIRES:
+    - vars: array with variables to collect
+    - timeframes: list of (startTime, endTime) requests that will be made later, ex. one per sim run
+
+    EFFECTS: scrapes the union of all timeframes that aren't cached yet with as few CDAWeb requests
+    as possible (see planFetches). Later scrapeData calls for any of the timeframes are served by
+    slicing the fetched data. Returns the number of requests made.
+    """
+    offline = configs["omniOffline"]
+
+    missing = []
+    for startTime, endTime in set(timeframes):
+        if (tuple(vars), startTime, endTime) in cachedData or findCachedInterval(vars, startTime, endTime) is not None:
+            continue
+
+        if omniCacheFolder() is not None and all(findObservationCacheFile(var, startTime, endTime, offline) is not None for var in vars):
+            continue
+
+        missing.append((startTime, endTime))
+
+    # offline requests fail in scrapeData when the timeframe is actually requested
+    if offline:
+        return 0
+
+    fetches = planFetches(missing)
+    for startTime, endTime in fetches:
+        scrapeData(vars, startTime, endTime)
+
+    return len(fetches)
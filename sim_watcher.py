@@ -0,0 +1,207 @@
+import os
+import time
+import threading
+from config_local import *
+from data_parser import parseSimParams
+from data_cache import runFingerprint
+from data_index import RotationRuns, listSimFolders
+
+def simSnapshot(simDirectory):
+    """
+    REQUIRES:
+    - simDirectory: folder containing run###_AWSoM folders
+
+    EFFECTS: returns a dict of run name -> fingerprint (see data_cache.runFingerprint) of every run
+    whose param and result files both exist. Runs still missing a file are left out until they're complete.
+    """
+    snapshot = dict()
+
+    for run in listSimFolders(simDirectory):
+        try:
+            snapshot[run] = runFingerprint(os.path.join(simDirectory, run))
+        except OSError:
+            continue
+
+    return snapshot
+
+def startEventObserver(simDirectory, wakeUp):
+    """
+    REQUIRES:
+    - simDirectory: folder to watch, recursively
+    - wakeUp: threading.Event set on every file system event
+
+    EFFECTS: starts and returns a watchdog observer (inotify on Linux), or None if watchdog isn't installed
+    """
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+    except ImportError:
+        return None
+
+    class WakeUpHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            wakeUp.set()
+
+    observer = Observer()
+    observer.schedule(WakeUpHandler(), simDirectory, recursive = True)
+    observer.start()
+
+    return observer
+
+class SimWatcher:
+    """
+    Keeps the rotation index and loaded runs of a sim directory in memory and updates the
+    affected rotations when run folders are added, changed or removed.
+
+    Changes are detected from file system events when watchdog is installed, otherwise by
+    rescanning the sim directory every watchPollSeconds. A rescan compares each run's file
+    fingerprints, so events only decide when to look. Updates wait until the directory has been
+    unchanged for watchDebounceSeconds, so runs that are still being written are handled once.
+    """
+
+    def __init__(self, simDirectory, rotationData, updateRotation, rotations = None, useCache = True, rebuildCache = False):
+        """
+        REQUIRES:
+        - simDirectory: folder containing run###_AWSoM folders
+        - rotationData: dict of rotation name -> RotationRuns of simDirectory (see data_index.buildRotationIndex),
+        updated in place
+        - updateRotation: function(rotation, rotationData) called for every affected rotation (ex. to rescore and replot it)
+        - rotations (default = all): names of the rotations to watch
+        - useCache, rebuildCache: how runs of new rotations are loaded (see data_cache.loadSimRun)
+        """
+        self.simDirectory = simDirectory
+        self.rotationData = rotationData
+        self.updateRotation = updateRotation
+        self.rotations = rotations
+        self.useCache = useCache
+        self.rebuildCache = rebuildCache
+
+        self.runRotations = {run: rotation for rotation, runResults in rotationData.items() for run in runResults}
+        self.snapshot = simSnapshot(simDirectory)
+        self.wakeUp = threading.Event()
+
+        # indexed runs without results yet (ex. jobs still running) are added once they're complete
+        for run, rotation in list(self.runRotations.items()):
+            if run not in self.snapshot:
+                rotationData[rotation].removeRun(run)
+                del self.runRotations[run]
+
+                if len(rotationData[rotation]) == 0:
+                    del rotationData[rotation]
+
+    def applyChanges(self, snapshot):
+        """
+        REQUIRES:
+        - snapshot: new result of simSnapshot
+
+        EFFECTS: adds, reindexes or removes every run that differs from the previous snapshot and
+        returns the sorted names of the watched rotations that changed
+        """
+        changedRuns = [run for run in snapshot.keys() | self.snapshot.keys() if snapshot.get(run) != self.snapshot.get(run)]
+        affected = set()
+
+        for run in changedRuns:
+            # changed runs are removed first, their params (and so their rotation) may have changed too
+            oldRotation = self.runRotations.pop(run, None)
+            if oldRotation is not None:
+                self.rotationData[oldRotation].removeRun(run)
+                affected.add(oldRotation)
+
+            if run not in snapshot:
+                continue
+
+            try:
+                params = parseSimParams(os.path.join(self.simDirectory, run, configs["simParamLocation"]))
+            except (OSError, ValueError, KeyError, IndexError) as error:
+                print(f"Skipping {run}, its params couldn't be read: {error!r}")
+                continue
+
+            rotation = params["rotation"]
+            if rotation not in self.rotationData:
+                self.rotationData[rotation] = RotationRuns(rotation, self.simDirectory, self.useCache, self.rebuildCache)
+
+            self.rotationData[rotation].addRun(run, params)
+            self.runRotations[run] = rotation
+            affected.add(rotation)
+
+        self.snapshot = snapshot
+
+        # rotations without runs left are dropped from the index
+        for rotation in list(affected):
+            if len(self.rotationData[rotation]) == 0:
+                del self.rotationData[rotation]
+                print(f"Rotation {rotation} has no runs left")
+                affected.discard(rotation)
+
+        if self.rotations is not None:
+            affected &= set(self.rotations)
+
+        return sorted(affected)
+
+    def settledSnapshot(self):
+        """
+        EFFECTS: waits until the sim directory has been unchanged for watchDebounceSeconds and returns
+        its snapshot, or returns None right away if nothing changed since the last update
+        """
+        snapshot = simSnapshot(self.simDirectory)
+        if snapshot == self.snapshot:
+            return None
+
+        while True:
+            self.wakeUp.clear()
+            time.sleep(configs["watchDebounceSeconds"])
+
+            newSnapshot = simSnapshot(self.simDirectory)
+            if newSnapshot == snapshot:
+                return snapshot
+
+            snapshot = newSnapshot
+
+    def update(self, rotation):
+        """
+        EFFECTS: calls updateRotation for the rotation and prints how long it took. Errors are printed
+        instead of raised, so one failing rotation (ex. observations not available yet) doesn't stop the watch.
+        """
+        startTime = time.perf_counter()
+        try:
+            self.updateRotation(rotation, self.rotationData)
+        except Exception as error:
+            print(f"\nError: rotation {rotation} couldn't be updated: {error!r}")
+            return
+
+        print(f"Updated rotation {rotation} in {time.perf_counter() - startTime:.1f}s")
+
+    def watch(self, initialRotations = ()):
+        """
+        REQUIRES:
+        - initialRotations (default = none): rotations to update before watching (ex. to bring their outputs up to date)
+
+        EFFECTS: updates the affected rotations on every change of the sim directory, until interrupted (ctrl + c)
+        """
+        observer = startEventObserver(self.simDirectory, self.wakeUp)
+        if observer is None:
+            print(f"Watching {self.simDirectory} every {configs['watchPollSeconds']}s (install watchdog to use file system events)")
+        else:
+            print(f"Watching {self.simDirectory} for file system events")
+
+        try:
+            for rotation in initialRotations:
+                self.update(rotation)
+
+            while True:
+                # with events, the directory is still rescanned now and then in case one was missed
+                self.wakeUp.wait(configs["watchPollSeconds"] if observer is None else configs["watchRescanSeconds"])
+                self.wakeUp.clear()
+
+                snapshot = self.settledSnapshot()
+                if snapshot is None:
+                    continue
+
+                for rotation in self.applyChanges(snapshot):
+                    self.update(rotation)
+        except KeyboardInterrupt:
+            print("\nStopped watching")
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
@@ -0,0 +1,75 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+from config_local import *
+from synthetic import makeCampaign, FakeCdasWs
+from data_index import buildRotationIndex
+from ranking import bestScoreIndex
+from scrape_data import setCdasClient, clearCachedData
+from score_gen import scoreRotation
+from flux_fit import fitOptimalFlux
+
+METHODS = ["mae", "mse", "scc", "curve_distance"]
+
+@pytest.fixture(scope = "module")
+def simDirectory(tmp_path_factory):
+    # more runs than sweep fluxes, so some fluxes have several realizations
+    return makeCampaign(str(tmp_path_factory.mktemp("campaign")), 24)
+
+@pytest.mark.parametrize("method", METHODS)
+def test_best_flux_agrees(method, simDirectory, tmp_path, monkeypatch):
+    monkeypatch.setitem(configs, "diffCalcMethod", method)
+    monkeypatch.setitem(configs, "outputDataFolder", str(tmp_path))
+    monkeypatch.setitem(configs, "omniCacheFolder", None)
+    setCdasClient(FakeCdasWs())
+
+    try:
+        rotationData = buildRotationIndex(simDirectory, useCache = False)
+        scores = scoreRotation("20120516", rotationData, writeDataFile = False)
+    finally:
+        setCdasClient(None)
+        clearCachedData()
+
+    fluxes = np.array([float(poyntingFlux) for poyntingFlux in scores["poyntingFluxes"]])
+    bestFlux = float(scores["bestPoyntingFlux"])
+
+    # the best run has the lowest average difference
+    assert scores["diffAverages"][scores["bestIndex"]] == np.nanmin(scores["diffAverages"])
+
+    # the poynting flux plot marks the lowest average of the runs sorted by flux
+    order = np.argsort(fluxes, kind = "stable")
+    plotIndex = bestScoreIndex(np.array(scores["diffAverages"])[order], method, oriented = True)
+    assert fluxes[order][plotIndex] == bestFlux
+
+    # the fit is centered on the same flux
+    assert scores["fluxFit"]["bestFlux"] == bestFlux
+
+def test_fit_uses_given_best_flux():
+    fluxes = [1e5, 2e5, 2e5, 3e5, 4e5]
+    averages = [0.5, 0.1, 0.9, 0.4, 0.6]
+
+    # by mean per flux 3e5 is best, the best single run is at 2e5
+    assert fitOptimalFlux(fluxes, averages)["bestFlux"] == 3e5
+    assert fitOptimalFlux(fluxes, averages, 2e5)["bestFlux"] == 2e5
+
+def test_flux_fit_file_is_strict_json(tmp_path, monkeypatch):
+    import json
+    from flux_fit import writeFluxFit
+
+    monkeypatch.setitem(configs, "outputDataFolder", str(tmp_path))
+
+    # a single flux can't be fitted, its uncertainty is nan
+    fit = fitOptimalFlux([5e5, 5e5], [0.2, 0.3])
+    writeFluxFit("20120516", fit)
+
+    with open(tmp_path / "20120516_flux_fit.json") as file:
+        written = json.load(file, parse_constant = lambda constant: pytest.fail(f"{constant} in flux fit file"))
+
+    assert written["uncertainty"] is None
+    assert written["optimum"] == 5e5
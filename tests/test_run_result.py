@@ -0,0 +1,29 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from data_parser import RunResult, RUN_RESULT_DTYPE
+
+def makeRunResult():
+    return RunResult(np.zeros(3, dtype = RUN_RESULT_DTYPE), "run001_AWSoM", "500000")
+
+def test_missing_key_raises_key_error():
+    runResult = makeRunResult()
+    with pytest.raises(KeyError):
+        runResult["missing"]
+
+def test_missing_key_in_and_get():
+    runResult = makeRunResult()
+    assert "missing" not in runResult
+    assert runResult.get("missing") is None
+    assert runResult.get("missing", 1) == 1
+
+def test_columns_and_metadata():
+    runResult = makeRunResult()
+    assert "U" in runResult
+    assert len(runResult.get("U")) == 3
+    assert runResult["poyntingFlux"] == "500000"
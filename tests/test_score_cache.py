@@ -0,0 +1,22 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import score_cache
+from config_local import *
+from score_cache import readScoreStore, writeScoreStore
+
+RUNS = {"run001_AWSoM": {"fingerprint": [], "poyntingFlux": "500000", "scrapeWindow": [], "rawDiffValues": [0.1, 0.2, 0.3, 0.4]}}
+
+def test_store_is_reused_with_same_settings(tmp_path, monkeypatch):
+    monkeypatch.setitem(configs, "outputDataFolder", str(tmp_path))
+    writeScoreStore("20120516", RUNS)
+    assert readScoreStore("20120516") == RUNS
+
+def test_store_is_dropped_when_score_version_changes(tmp_path, monkeypatch):
+    monkeypatch.setitem(configs, "outputDataFolder", str(tmp_path))
+    writeScoreStore("20120516", RUNS)
+
+    monkeypatch.setattr(score_cache, "scoreVersion", score_cache.scoreVersion + 1)
+    assert readScoreStore("20120516") == dict()